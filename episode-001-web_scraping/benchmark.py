@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import asyncio
+import subprocess
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import ty_exa_script
+from llm_cache import ResponseCache
+from providers import FakeProvider
+
+# Number of fake Exa results to generate training data for
+NUM_FAKE_RESULTS = 40
+# In-flight limits to compare against the sequential run
+CONCURRENCY_LEVELS = [1, 4, 8, 16]
+# Requests per provider for the throughput benchmark, and how many are in flight at once
+NUM_PROVIDER_REQUESTS = 40
+PROVIDER_CONCURRENCY = 8
+# How many requests the throttling fake server handles at once, and how many the client starts with
+FAKE_SERVER_CAPACITY = 6
+CLIENT_MAX_CONCURRENCY = 24
+# Max cumulative import time of ty_exa_script, checked with `python -X importtime`
+IMPORT_TIME_BUDGET_MS = 200
+# Modules that must not be imported until they're actually used
+LAZY_MODULES = ["dspy", "dsp", "exa_py", "anthropic", "openai", "ollama", "httpx", "asyncio"]
+
+
+def make_fake_exa_responses(n):
+    return [SimpleNamespace(summary=f"Fake summary {i} about an interesting AI startup.") for i in range(n)]
+
+
+def benchmark_user_query_fanout():
+    # Run against the local fake provider so no API calls (or money) are spent
+    ty_exa_script.LLM_PROVIDER = "fake"
+    # Every level has to make real (fake) calls, so keep the response cache out of it
+    ty_exa_script.LLM_CACHE_ENABLED = False
+    exa_responses = make_fake_exa_responses(NUM_FAKE_RESULTS)
+
+    print(f"\n⏱️  Generating {NUM_FAKE_RESULTS} user queries, fake latency {ty_exa_script.FAKE_LLM_LATENCY}s per call\n")
+    baseline = None
+    for max_concurrency in CONCURRENCY_LEVELS:
+        start_time = time.time()
+        queries = list(ty_exa_script.generate_likely_user_queries(exa_responses, max_concurrency=max_concurrency))
+        elapsed = time.time() - start_time
+        assert len(queries) == NUM_FAKE_RESULTS
+        baseline = baseline or elapsed
+        print(f"in-flight={max_concurrency:<3} {elapsed:6.2f}s  speedup {baseline / elapsed:5.1f}x")
+
+
+def benchmark_cache_rerun():
+    # A rerun with the same prompts should be served entirely from the response cache
+    ty_exa_script.LLM_PROVIDER = "fake"
+    ty_exa_script.LLM_CACHE_ENABLED = True
+    ty_exa_script.llm_cache = ResponseCache(path=":memory:")
+    exa_responses = make_fake_exa_responses(NUM_FAKE_RESULTS)
+
+    print(f"\n⏱️  Rerunning {NUM_FAKE_RESULTS} user queries through the response cache\n")
+    for run in ["cold", "warm"]:
+        start_time = time.time()
+        list(ty_exa_script.generate_likely_user_queries(exa_responses))
+        elapsed = time.time() - start_time
+        print(f"{run:<5} {elapsed * 1000:8.1f}ms  {ty_exa_script.llm_cache.stats()}")
+
+
+def benchmark_provider_throughput(provider_name, model="cheap"):
+    # Same harness for every provider: N short prompts through complete() on a thread pool, then acomplete() on asyncio
+    ty_exa_script.LLM_PROVIDER = provider_name
+    provider = ty_exa_script.get_llm_provider()
+    model = ty_exa_script.resolve_model(model)
+    prompts = [f"Reply with the number {i} and nothing else." for i in range(NUM_PROVIDER_REQUESTS)]
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=PROVIDER_CONCURRENCY) as executor:
+        list(executor.map(lambda prompt: provider.complete(prompt, model, max_tokens=16), prompts))
+    sync_elapsed = time.time() - start_time
+
+    async def run_async():
+        semaphore = asyncio.Semaphore(PROVIDER_CONCURRENCY)
+
+        async def complete(prompt):
+            async with semaphore:
+                return await provider.acomplete(prompt, model, max_tokens=16)
+
+        return await asyncio.gather(*(complete(prompt) for prompt in prompts))
+
+    start_time = time.time()
+    asyncio.run(run_async())
+    async_elapsed = time.time() - start_time
+
+    print(f"{provider_name:<10} threads {NUM_PROVIDER_REQUESTS / sync_elapsed:6.1f} req/s   asyncio {NUM_PROVIDER_REQUESTS / async_elapsed:6.1f} req/s")
+
+
+def benchmark_throttling():
+    # Fake server that returns 429s whenever it's over capacity, the limiter should back off and settle
+    # its concurrency near the server's capacity instead of hammering it with retries
+    provider = FakeProvider(latency=0.05, capacity=FAKE_SERVER_CAPACITY, limits={"max_concurrency": CLIENT_MAX_CONCURRENCY, "base_delay": 0.05})
+    prompts = [f"Prompt {i}" for i in range(NUM_PROVIDER_REQUESTS * 5)]
+
+    print(f"\n⏱️  {len(prompts)} requests against a fake server that throttles above {FAKE_SERVER_CAPACITY} in flight\n")
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=CLIENT_MAX_CONCURRENCY) as executor:
+        list(executor.map(lambda prompt: provider.complete(prompt, "fake"), prompts))
+    elapsed = time.time() - start_time
+    print(f"{len(prompts) / elapsed:6.1f} req/s, {provider.rejected} of {provider.requests} server requests rejected, limiter {provider.limiter.stats()}")
+
+
+def check_import_time():
+    # Import the script in a fresh interpreter and read the timings -X importtime writes to stderr
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import ty_exa_script"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    imported = {}
+    for line in result.stderr.splitlines():
+        # Lines look like: "import time:       123 |       4567 | package.module"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        imported[module.strip()] = int(cumulative) / 1000
+
+    import_ms = imported.get("ty_exa_script", 0)
+    eager = [module for module in LAZY_MODULES if module in imported]
+    print(f"\n⏱️  Importing ty_exa_script took {import_ms:.1f}ms (budget {IMPORT_TIME_BUDGET_MS}ms)\n")
+    if result.returncode != 0:
+        print(result.stderr)
+        return False
+    if eager:
+        print(f"❌ Imported eagerly: {', '.join(eager)}")
+    if import_ms > IMPORT_TIME_BUDGET_MS:
+        print("❌ Import time is over budget")
+    return not eager and import_ms <= IMPORT_TIME_BUDGET_MS
+
+
+if __name__ == "__main__":
+    # `python benchmark.py --import-time` only runs the import time check, and exits non-zero if it fails
+    if "--import-time" in sys.argv:
+        sys.exit(0 if check_import_time() else 1)
+    check_import_time()
+    benchmark_user_query_fanout()
+    benchmark_cache_rerun()
+    # Pass provider names to compare real providers too, e.g. `python benchmark.py anthropic openai`
+    print(f"\n⏱️  Provider throughput, {NUM_PROVIDER_REQUESTS} requests, {PROVIDER_CONCURRENCY} in flight\n")
+    for provider_name in ["fake"] + sys.argv[1:]:
+        benchmark_provider_throughput(provider_name)
+    benchmark_throttling()
@@ -0,0 +1,35 @@
+import dspy
+
+
+# Define the DSPy signature for prompt optimization
+class OptimizeUserQuery(dspy.Signature):
+    """Based on the user query, enhance the user query to add context, and make it more useful for an AI assistant"""
+    user_prompt = dspy.InputField()
+    optimized_prompt = dspy.OutputField()
+
+# Create a DSPy module to optimize the prompt
+class UserQueryOptimizer(dspy.Module):
+    def __init__(self):
+        super().__init__()
+        self.optimize = dspy.ChainOfThought(OptimizeUserQuery)
+
+    def forward(self, user_prompt):
+        optimized = self.optimize(user_prompt=user_prompt)
+        return optimized.optimized_prompt
+
+
+# Define the DSPy signature for prompt optimization
+class OptimizePrompt(dspy.Signature):
+    """Based on the user query, generate a summary prompt to create a useful prompt for an AI assistant that will summarize a website. The summary prompt should be formatted in a way that it can be used as an input to the AI assistant, and should be themed around the user query. The summary prompt should be formatted as a single string, with no line breaks or other formatting. The summary prompt should be at least 5-7 sentences long, but no more than 8 sentences. Remember, this should be a prompt for an AI assistant, write in in the format of a LLM prompt.  IMPORTANT: Do NOT talk about the website, only the contents of the website.  Only include information about the content of the website, avoid language like: "This article..." or "This page..."""
+    user_prompt = dspy.InputField()
+    optimized_prompt = dspy.OutputField()
+
+# Create a DSPy module to optimize the prompt
+class SummaryPromptOptimizer(dspy.Module):
+    def __init__(self):
+        super().__init__()
+        self.optimize = dspy.ChainOfThought(OptimizePrompt)
+
+    def forward(self, user_prompt):
+        optimized = self.optimize(user_prompt=user_prompt)
+        return dspy.Prediction(optimized_prompt=optimized.optimized_prompt)
@@ -0,0 +1,164 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from rate_limit import TokenBucket
+
+# Where the index of already harvested documents lives on disk
+DEFAULT_INDEX_PATH = os.path.expanduser("~/.cache/tool-use/exa_index.sqlite")
+# Query string parameters that don't change which document a URL points to
+TRACKING_PARAMS = {"ref", "fbclid", "gclid", "mc_cid", "mc_eid"}
+
+
+def normalize_url(url):
+    # Collapse the different spellings of the same URL, so they dedup to one document
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = [(k, v) for k, v in parse_qsl(parts.query)
+             if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme, host, path, urlencode(sorted(query)), ""))
+
+
+def content_hash(text):
+    # Whitespace and case insensitive, so trivially different copies of a page dedup as well
+    normalized = " ".join((text or "").lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class HarvestIndex:
+    # Persistent record of every document harvested so far, by normalized URL and content hash.
+    # New documents are only staged in memory until commit(), which is called once the training data
+    # made from them is on disk, so a crash in between means they're fetched again, not lost.
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # url -> (content hash, query) of documents harvested but not committed yet
+        self._staged = {}
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                query TEXT,
+                harvested_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_content_hash ON documents (content_hash)")
+        self._conn.commit()
+
+    def has_url(self, url):
+        with self._lock:
+            if url in self._staged:
+                return True
+            return self._conn.execute("SELECT 1 FROM documents WHERE url = ?", (url,)).fetchone() is not None
+
+    def _insert(self, url, digest, query):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO documents (url, content_hash, query, harvested_at) VALUES (?, ?, ?, ?)",
+            (url, digest, query, time.time()),
+        )
+
+    def stage(self, url, text, query=None):
+        # Returns False if a document with the same content was already harvested or staged (under any URL).
+        # A copy of a committed document is recorded right away, there's nothing left to make from it.
+        digest = content_hash(text)
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM documents WHERE content_hash = ?", (digest,)).fetchone():
+                self._insert(url, digest, query)
+                self._conn.commit()
+                return False
+            is_duplicate = any(staged_digest == digest for staged_digest, _ in self._staged.values())
+            self._staged[url] = (digest, query)
+            return not is_duplicate
+
+    def commit(self, urls):
+        # Records the staged documents at these URLs, and any staged copies of them, in the index
+        with self._lock:
+            digests = {self._staged[url][0] for url in urls if url in self._staged}
+            for url, (digest, query) in list(self._staged.items()):
+                if digest in digests:
+                    self._insert(url, digest, query)
+                    del self._staged[url]
+            self._conn.commit()
+
+    def discard(self, urls):
+        # Forgets staged documents that didn't make it into the training data, so they can be harvested again
+        with self._lock:
+            for url in urls:
+                self._staged.pop(url, None)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+class ExaHarvester:
+    # Runs many searches concurrently, and only fetches contents for documents that aren't in the index yet
+    def __init__(self, exa_client, index, results_per_query=25, contents_page_size=10,
+                 max_concurrency=4, requests_per_second=5, rate_limiter=None):
+        self.exa = exa_client
+        self.index = index
+        self.results_per_query = results_per_query
+        self.contents_page_size = contents_page_size
+        self.max_concurrency = max_concurrency
+        # Pass a shared TokenBucket when several harvesters run at once, so the rate applies to all of them
+        self.rate_limiter = rate_limiter or TokenBucket(rate=requests_per_second)
+        self._claimed = set()
+        self._claimed_lock = threading.Lock()
+
+    def _claim_new(self, results):
+        # Keep the results whose URL hasn't been harvested before, or claimed by another query in this run
+        new_results = []
+        with self._claimed_lock:
+            for result in results:
+                url = normalize_url(result.url)
+                if url in self._claimed or self.index.has_url(url):
+                    continue
+                self._claimed.add(url)
+                new_results.append(result)
+        return new_results
+
+    def _harvest_query(self, query, summary_prompt):
+        # Search without contents first, it's cheap and tells us which documents are new
+        self.rate_limiter.acquire()
+        search_response = self.exa.search(
+            query,
+            type="neural",
+            use_autoprompt=True,
+            num_results=self.results_per_query,
+        )
+        new_results = self._claim_new(search_response.results)
+
+        harvested = []
+        # Fetch contents (with summaries) for the new documents only, a page of ids at a time
+        for page_start in range(0, len(new_results), self.contents_page_size):
+            page_ids = [result.id for result in new_results[page_start:page_start + self.contents_page_size]]
+            self.rate_limiter.acquire()
+            contents = self.exa.get_contents(page_ids, summary={"query": summary_prompt})
+            for result in contents.results:
+                text = getattr(result, "text", None) or result.summary
+                if self.index.stage(normalize_url(result.url), text, query=query):
+                    harvested.append(result)
+        return harvested
+
+    def harvest(self, queries, summary_prompt):
+        # Returns the new documents for all queries, in query order
+        self._claimed = set()
+        all_results = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = [executor.submit(self._harvest_query, query, summary_prompt) for query in queries]
+            for query, future in zip(queries, futures):
+                try:
+                    results = future.result()
+                    print(f"🔎 {len(results)} new documents for: {query[:80]}")
+                    all_results.extend(results)
+                except Exception as e:
+                    print(f"❌ Error harvesting query '{query[:80]}': {str(e)}")
+        return all_results
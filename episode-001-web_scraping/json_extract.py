@@ -0,0 +1,153 @@
+import re
+import ast
+import json
+import threading
+
+# Markdown code fences around the JSON, with or without a language tag
+FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+# Commas right before a closing bracket, which json.loads rejects
+TRAILING_COMMA_PATTERN = re.compile(r",\s*[}\]]")
+SMART_QUOTES = {"“": '"', "”": '"', "‘": "'", "’": "'"}
+
+
+class ExtractionStats:
+    # How each structured response was obtained: native provider JSON/tool mode, plain json.loads,
+    # repaired locally, or not recoverable (which costs another call)
+    def __init__(self):
+        self.counts = {"native": 0, "parsed": 0, "repaired": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def record(self, kind):
+        with self._lock:
+            self.counts[kind] += 1
+
+    def recovery_rate(self):
+        # Share of malformed responses that were fixed locally instead of asking the model again
+        malformed = self.counts["repaired"] + self.counts["failed"]
+        return self.counts["repaired"] / malformed if malformed else 1.0
+
+    def __str__(self):
+        return ", ".join(f"{count} {kind}" for kind, count in self.counts.items()) + f" ({self.recovery_rate():.0%} of malformed recovered)"
+
+
+extraction_stats = ExtractionStats()
+
+
+def _balanced_from(text, start):
+    # The complete {...} or [...] starting at text[start], skipping brackets inside strings
+    closing = {"{": "}", "[": "]"}
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in closing:
+            stack.append(closing[c])
+        elif stack and c == stack[-1]:
+            stack.pop()
+            if not stack:
+                return text[start:i + 1]
+    return None
+
+
+def _find_balanced(text):
+    # Each complete {...} or [...] in the text in turn, so a stray "[note]" before the JSON doesn't hide it.
+    # Brackets inside one that was already tried are skipped, a piece of broken JSON isn't the answer.
+    start = 0
+    while start < len(text):
+        if text[start] in "{[":
+            balanced = _balanced_from(text, start)
+            if balanced:
+                yield balanced
+                start += len(balanced)
+                continue
+        start += 1
+
+
+def _candidates(text):
+    fenced = FENCE_PATTERN.search(text)
+    if fenced:
+        yield fenced.group(1).strip()
+    yield from _find_balanced(text)
+
+
+def _normalize(candidate):
+    # Plain quotes for smart ones used as string delimiters, and no trailing commas. Only outside string
+    # literals, an apostrophe or ", ]" inside a value is left as it is.
+    out = []
+    quote = None  # plain quote character of the string we're in
+    smart = False  # whether that string was opened with a smart quote
+    escaped = False
+    for i, c in enumerate(candidate):
+        if quote:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif (SMART_QUOTES.get(c) == quote) if smart else (c == quote):
+                out.append(quote)
+                quote = None
+                continue
+            elif smart and c == quote:
+                # A plain quote inside a “smart quoted” string is part of the value
+                out.append("\\" + c)
+                continue
+            out.append(c)
+        elif c in SMART_QUOTES or c in "\"'":
+            quote = SMART_QUOTES.get(c, c)
+            smart = c in SMART_QUOTES
+            out.append(quote)
+        elif c == "," and TRAILING_COMMA_PATTERN.match(candidate, i):
+            continue
+        else:
+            out.append(c)
+    return "".join(out)
+
+
+def _repair(candidate):
+    candidate = _normalize(candidate)
+    try:
+        return json.loads(candidate)
+    except (json.JSONDecodeError, RecursionError):
+        # Very deeply nested input overflows the parser's stack
+        pass
+    # Single quotes and True/False/None, i.e. a Python literal instead of JSON
+    try:
+        value = ast.literal_eval(candidate)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        # e.g. {[1]: 2} is valid syntax but an unhashable key
+        return None
+    if isinstance(value, (dict, list)):
+        return value
+    return None
+
+
+def extract_json(text):
+    # Parses JSON out of an LLM response, repairing the usual problems (code fences, text before or
+    # after the JSON, trailing commas, smart quotes, Python literals). Raises ValueError if it can't.
+    if isinstance(text, (dict, list)):
+        return text
+    try:
+        value = json.loads(text)
+        extraction_stats.record("parsed")
+        return value
+    except (json.JSONDecodeError, TypeError, RecursionError):
+        pass
+
+    for candidate in _candidates(text or ""):
+        value = _repair(candidate)
+        if value is not None:
+            extraction_stats.record("repaired")
+            return value
+
+    extraction_stats.record("failed")
+    raise ValueError(f"No valid JSON found in response: {(text or '')[:100]}")
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Where cached LLM responses live on disk
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.cache/tool-use/llm_cache.sqlite")
+# Drop cached responses older than this (seconds)
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+# Keep at most this many responses, least recently used ones are evicted first
+DEFAULT_MAX_ENTRIES = 20000
+# Run eviction once every this many writes
+EVICT_EVERY_N_WRITES = 100
+
+
+def make_cache_key(provider, model, prompt, temperature, max_tokens, **extra):
+    # Content-addressed key, the same request always hashes to the same key
+    payload = {
+        "provider": provider,
+        "model": model,
+        "prompt": prompt,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        **extra,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_age=DEFAULT_MAX_AGE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Open the database on first use, so importing the script doesn't touch the disk
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self._evict()
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or time.time() - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY_N_WRITES == 0:
+                self._evict()
+            conn.commit()
+
+    def _evict(self):
+        # Age-based eviction first, then trim the least recently used entries down to max_entries
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+        self._conn.execute("""
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+        self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedLM:
+    # Wraps a DSPy LM so its completions go through a ResponseCache, everything else is passed through
+    def __init__(self, lm, cache):
+        self.lm = lm
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.lm, name)
+
+    def __call__(self, prompt, **kwargs):
+        request_kwargs = {**self.lm.kwargs, **kwargs}
+        # Keyed on the real LM's type, so wrapping it in a LimitedLM doesn't change the keys
+        key = make_cache_key(
+            provider=type(getattr(self.lm, "lm", self.lm)).__name__,
+            model=request_kwargs.pop("model", None),
+            prompt=prompt,
+            temperature=request_kwargs.pop("temperature", None),
+            max_tokens=request_kwargs.pop("max_tokens", None),
+            **request_kwargs,
+        )
+        completions = self.cache.get(key)
+        if completions is None:
+            completions = self.lm(prompt, **kwargs)
+            self.cache.set(key, completions)
+        return completions
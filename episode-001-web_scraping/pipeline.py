@@ -0,0 +1,92 @@
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Stage:
+    def __init__(self, name, fn, concurrency=1):
+        self.name = name
+        self.fn = fn
+        self.concurrency = concurrency
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, value):
+        start_time = time.time()
+        try:
+            return self.fn(value)
+        finally:
+            with self._lock:
+                self.completed += 1
+                self.busy_seconds += time.time() - start_time
+
+
+class Pipeline:
+    # Runs every item through the stages in order. Each stage has its own worker pool, so stage N of
+    # item i runs at the same time as stage N-1 of item i+1. Results are handed to on_result in the
+    # calling thread, as soon as each item finishes (not necessarily in input order).
+    def __init__(self, stages, max_in_flight=None, report_every=30):
+        self.stages = stages
+        # Cap on items between the first and the last stage, so fast early stages can't pile up work
+        self.max_in_flight = max_in_flight or 2 * sum(stage.concurrency for stage in stages)
+        self.report_every = report_every
+
+    def run(self, items, on_result, on_error=None):
+        items = list(items)
+        executors = [ThreadPoolExecutor(max_workers=stage.concurrency, thread_name_prefix=stage.name) for stage in self.stages]
+        finished = queue.Queue()
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+        def submit(stage_index, item_index, value):
+            future = executors[stage_index].submit(self.stages[stage_index].run, value)
+            future.add_done_callback(lambda f: on_stage_done(stage_index, item_index, f))
+
+        def on_stage_done(stage_index, item_index, future):
+            error = future.exception()
+            if error is not None:
+                finished.put((item_index, None, self.stages[stage_index].name, error))
+            elif stage_index + 1 < len(self.stages):
+                submit(stage_index + 1, item_index, future.result())
+            else:
+                finished.put((item_index, future.result(), None, None))
+
+        def feed():
+            for item_index, item in enumerate(items):
+                in_flight.acquire()
+                submit(0, item_index, item)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        start_time = last_report = time.time()
+        succeeded = failed = 0
+        try:
+            feeder.start()
+            for _ in range(len(items)):
+                item_index, result, failed_stage, error = finished.get()
+                in_flight.release()
+                if error is None:
+                    succeeded += 1
+                    on_result(items[item_index], result)
+                else:
+                    failed += 1
+                    if on_error:
+                        on_error(items[item_index], failed_stage, error)
+                if time.time() - last_report >= self.report_every:
+                    self.report(succeeded, failed, len(items), start_time)
+                    last_report = time.time()
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+        self.report(succeeded, failed, len(items), start_time)
+        return succeeded, failed
+
+    def report(self, succeeded, failed, total, start_time):
+        elapsed = time.time() - start_time
+        done = succeeded + failed
+        rate = done / elapsed * 60 if elapsed else 0.0
+        stage_stats = ", ".join(
+            f"{stage.name} {stage.busy_seconds / stage.completed:.1f}s avg" if stage.completed else f"{stage.name} -"
+            for stage in self.stages
+        )
+        print(f"\n📊 {done}/{total} done ({failed} failed) in {elapsed:.0f}s, {rate:.1f} items/min | {stage_stats}\n")
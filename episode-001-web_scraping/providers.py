@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import random
+import threading
+from rate_limit import ProviderLimiter
+from json_extract import extract_json, extraction_stats
+
+# Size of each provider's HTTP connection pool, should be at least the number of LLM calls in flight
+MAX_CONNECTIONS = 32
+# Default request/token budgets per minute and max concurrency per provider, adjust to your account's tier
+PROVIDER_LIMITS = {
+    "anthropic": {"rpm": 50, "tpm": 40000, "max_concurrency": 16},
+    "openai": {"rpm": 500, "tpm": 200000, "max_concurrency": 32},
+    "ollama": {"max_concurrency": 4},
+    "fake": {"max_concurrency": 32},
+}
+
+
+def estimate_tokens(prompt):
+    # Rough count for the token budget, about 4 characters per token
+    return max(1, len(prompt) // 4)
+
+
+class Provider:
+    # One complete()/acomplete() interface over every LLM backend. Clients are only created
+    # the first time they're needed, and then reused for every call so connections are pooled.
+    name = None
+
+    def __init__(self, limits=None):
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        # Retries and backoff are handled here, for every provider the same way
+        self.limiter = ProviderLimiter(**(limits if limits is not None else PROVIDER_LIMITS.get(self.name, {})))
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = self._create_async_client()
+        return self._async_client
+
+    def _create_client(self):
+        raise NotImplementedError
+
+    def _create_async_client(self):
+        raise NotImplementedError
+
+    def complete(self, prompt, model, temperature=0.2, max_tokens=2024):
+        return self.limiter.call(
+            lambda: self._complete(prompt, model, temperature, max_tokens),
+            tokens=estimate_tokens(prompt),
+        )
+
+    async def acomplete(self, prompt, model, temperature=0.2, max_tokens=2024):
+        return await self.limiter.acall(
+            lambda: self._acomplete(prompt, model, temperature, max_tokens),
+            tokens=estimate_tokens(prompt),
+        )
+
+    def complete_json(self, prompt, model, schema, temperature=0.2, max_tokens=2024):
+        # Structured output, returns the parsed JSON object. Uses the provider's JSON/tool mode where
+        # there is one, and repairs the response locally otherwise.
+        return self.limiter.call(
+            lambda: self._complete_json(prompt, model, schema, temperature, max_tokens),
+            tokens=estimate_tokens(prompt),
+        )
+
+    def _complete(self, prompt, model, temperature, max_tokens):
+        raise NotImplementedError
+
+    async def _acomplete(self, prompt, model, temperature, max_tokens):
+        raise NotImplementedError
+
+    def _complete_json(self, prompt, model, schema, temperature, max_tokens):
+        return extract_json(self._complete(prompt, model, temperature, max_tokens))
+
+
+class AnthropicProvider(Provider):
+    name = "anthropic"
+
+    def __init__(self, api_key=None, limits=None):
+        super().__init__(limits)
+        self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
+
+    # The SDK's own retries are turned off, ProviderLimiter retries instead
+    def _create_client(self):
+        import anthropic
+        import httpx
+        http_client = anthropic.DefaultHttpxClient(limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS))
+        return anthropic.Anthropic(api_key=self.api_key, http_client=http_client, max_retries=0)
+
+    def _create_async_client(self):
+        import anthropic
+        import httpx
+        http_client = anthropic.DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS))
+        return anthropic.AsyncAnthropic(api_key=self.api_key, http_client=http_client, max_retries=0)
+
+    def _request(self, prompt, model, temperature, max_tokens):
+        return dict(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=[{"role": "user", "content": prompt}],
+        )
+
+    def _text(self, message):
+        return message.content[0].text if isinstance(message.content, list) else message.content
+
+    def _complete(self, prompt, model, temperature, max_tokens):
+        message = self.client.messages.create(**self._request(prompt, model, temperature, max_tokens))
+        return self._text(message)
+
+    async def _acomplete(self, prompt, model, temperature, max_tokens):
+        message = await self.async_client.messages.create(**self._request(prompt, model, temperature, max_tokens))
+        return self._text(message)
+
+    def _complete_json(self, prompt, model, schema, temperature, max_tokens):
+        # Force a single tool call whose input schema is the schema we want back
+        message = self.client.messages.create(
+            **self._request(prompt, model, temperature, max_tokens),
+            tools=[{"name": "respond", "description": "Respond with the requested data.", "input_schema": schema}],
+            tool_choice={"type": "tool", "name": "respond"},
+        )
+        for block in message.content:
+            if block.type == "tool_use":
+                extraction_stats.record("native")
+                return block.input
+        return extract_json(self._text(message))
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def __init__(self, api_key=None, limits=None):
+        super().__init__(limits)
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+
+    # The SDK's own retries are turned off, ProviderLimiter retries instead
+    def _create_client(self):
+        import openai
+        import httpx
+        http_client = openai.DefaultHttpxClient(limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS))
+        return openai.OpenAI(api_key=self.api_key, http_client=http_client, max_retries=0)
+
+    def _create_async_client(self):
+        import openai
+        import httpx
+        http_client = openai.DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS))
+        return openai.AsyncOpenAI(api_key=self.api_key, http_client=http_client, max_retries=0)
+
+    def _request(self, prompt, model, temperature, max_tokens):
+        return dict(
+            messages=[{"role": "user", "content": prompt}],
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=None,
+        )
+
+    def _complete(self, prompt, model, temperature, max_tokens):
+        response = self.client.chat.completions.create(**self._request(prompt, model, temperature, max_tokens))
+        return response.choices[0].message.content
+
+    async def _acomplete(self, prompt, model, temperature, max_tokens):
+        response = await self.async_client.chat.completions.create(**self._request(prompt, model, temperature, max_tokens))
+        return response.choices[0].message.content
+
+    def _complete_json(self, prompt, model, schema, temperature, max_tokens):
+        # JSON mode should give valid JSON (the prompt has to mention JSON), the schema is up to the prompt.
+        # It still goes through extract_json, a reply cut off by max_tokens isn't valid JSON.
+        response = self.client.chat.completions.create(
+            **self._request(prompt, model, temperature, max_tokens),
+            response_format={"type": "json_object"},
+        )
+        return extract_json(response.choices[0].message.content)
+
+
+class OllamaProvider(Provider):
+    name = "ollama"
+
+    def __init__(self, host=None, limits=None):
+        super().__init__(limits)
+        self.host = host or os.environ.get("OLLAMA_HOST")
+
+    def _create_client(self):
+        import ollama
+        return ollama.Client(host=self.host)
+
+    def _create_async_client(self):
+        import ollama
+        return ollama.AsyncClient(host=self.host)
+
+    def _request(self, prompt, model, temperature, max_tokens):
+        return dict(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            options={"temperature": temperature, "num_predict": max_tokens},
+        )
+
+    def _complete(self, prompt, model, temperature, max_tokens):
+        response = self.client.chat(**self._request(prompt, model, temperature, max_tokens))
+        return response["message"]["content"]
+
+    async def _acomplete(self, prompt, model, temperature, max_tokens):
+        response = await self.async_client.chat(**self._request(prompt, model, temperature, max_tokens))
+        return response["message"]["content"]
+
+    def _complete_json(self, prompt, model, schema, temperature, max_tokens):
+        response = self.client.chat(**self._request(prompt, model, temperature, max_tokens), format="json")
+        return extract_json(response["message"]["content"])
+
+
+class FakeRateLimitError(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests (fake)")
+        self.status_code = 429
+        self.retry_after = retry_after
+
+
+class FakeProvider(Provider):
+    # In-process stand-in for a real provider, sleeps to simulate network latency. Used for benchmarks.
+    # It can also act like a throttling server: it returns 429s at random (error_rate), or whenever more
+    # than `capacity` requests are in flight at once.
+    name = "fake"
+
+    def __init__(self, latency=0.5, error_rate=0.0, capacity=None, retry_after=None, limits=None):
+        super().__init__(limits)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._server_lock = threading.Lock()
+
+    def _admit(self):
+        with self._server_lock:
+            self.requests += 1
+            over_capacity = self.capacity is not None and self._in_flight >= self.capacity
+            if over_capacity or random.random() < self.error_rate:
+                self.rejected += 1
+                raise FakeRateLimitError(retry_after=self.retry_after)
+            self._in_flight += 1
+
+    def _finish(self):
+        with self._server_lock:
+            self._in_flight -= 1
+
+    def _response(self, prompt, model):
+        return f"Fake {model} response for: {prompt.strip()[:50]}"
+
+    def _wait(self):
+        self._admit()
+        try:
+            time.sleep(self.latency)
+        finally:
+            self._finish()
+
+    def _complete(self, prompt, model, temperature, max_tokens):
+        self._wait()
+        return self._response(prompt, model)
+
+    def _complete_json(self, prompt, model, schema, temperature, max_tokens):
+        self._wait()
+        # Wrapped in a code fence and some chatter, like a real model often does, so it goes through the repair path
+        value = {key: self._response(prompt, model) for key in schema.get("properties", {})}
+        return extract_json(f"Sure, here you go:\n```json\n{json.dumps(value)}\n```")
+
+    async def _acomplete(self, prompt, model, temperature, max_tokens):
+        import asyncio
+        self._admit()
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self._finish()
+        return self._response(prompt, model)
+
+
+PROVIDERS = {
+    "anthropic": AnthropicProvider,
+    "openai": OpenAIProvider,
+    "ollama": OllamaProvider,
+    "fake": FakeProvider,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_provider(name, provider_class):
+    PROVIDERS[name] = provider_class
+    _instances.pop(name, None)
+
+
+def get_provider(name, **options):
+    # One shared instance per provider, `options` are only used the first time it's created
+    if name not in _instances:
+        with _instances_lock:
+            if name not in _instances:
+                if name not in PROVIDERS:
+                    raise ValueError(f"Unknown LLM provider '{name}', expected one of: {', '.join(PROVIDERS)}")
+                _instances[name] = PROVIDERS[name](**options)
+    return _instances[name]
+
+
+class LimitedLM:
+    # Wraps a DSPy LM so its requests share the provider's limiter (budgets, concurrency, retries)
+    # with every other call to that provider, everything else is passed through
+    def __init__(self, lm, limiter):
+        self.lm = lm
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self.lm, name)
+
+    def __call__(self, prompt, **kwargs):
+        return self.limiter.call(lambda: self.lm(prompt, **kwargs), tokens=estimate_tokens(prompt))
@@ -0,0 +1,173 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+
+# episode-002-video_data_extraction/tys-demo/rate_limit.py has a copy of TokenBucket, change both together
+class TokenBucket:
+    # Thread-safe token bucket, allows bursts of up to `capacity` then refills at `rate` tokens per second
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1):
+        # Block until `tokens` are available, then take them
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# HTTP statuses worth retrying: timeouts, rate limits, server errors, and Anthropic's 529 "overloaded"
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def get_status_code(error):
+    # Anthropic/OpenAI errors have .status_code, Google API errors have .code, others keep it on .response
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def get_retry_after(error):
+    # Seconds the server asked us to wait, if it said
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        # urllib's HTTPError has the headers itself, the SDKs keep them on .response
+        headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+        value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    # It can also be an HTTP date, e.g. "Wed, 21 Oct 2026 07:28:00 GMT"
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_retryable(error):
+    status_code = get_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # Connection errors and timeouts don't have a status code
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__.endswith(("ConnectionError", "TimeoutError"))
+
+
+class AdaptiveConcurrency:
+    # AIMD concurrency limit: grows by one slot per limit's worth of successful calls, halves when throttled
+    def __init__(self, max_concurrency=16, min_concurrency=1, initial=None):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(initial or max_concurrency)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class ProviderLimiter:
+    # Per-provider request and token budgets, adaptive concurrency, and jittered exponential backoff
+    # that respects Retry-After. Wrap every call to the provider in call() / acall().
+    def __init__(self, rpm=None, tpm=None, max_concurrency=16, min_concurrency=1,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.request_bucket = TokenBucket(rate=rpm / 60, capacity=max(1, rpm // 10)) if rpm else None
+        self.token_bucket = TokenBucket(rate=tpm / 60, capacity=max(1, tpm // 10)) if tpm else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency=max_concurrency, min_concurrency=min_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled = 0
+
+    def _acquire(self, tokens):
+        self.concurrency.acquire()
+        if self.request_bucket:
+            self.request_bucket.acquire()
+        if self.token_bucket:
+            self.token_bucket.acquire(tokens)
+
+    def _backoff(self, error, attempt):
+        # Returns how long to wait before the next attempt, or None if the error shouldn't be retried
+        throttled = get_status_code(error) == 429
+        self.concurrency.release(throttled=throttled)
+        if throttled:
+            self.throttled += 1
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        self.retries += 1
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        # Full jitter, so throttled callers don't all come back at the same moment
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, tokens=1):
+        attempt = 0
+        while True:
+            self._acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.concurrency.release()
+            return result
+
+    async def acall(self, coro_fn, tokens=1):
+        import asyncio
+        attempt = 0
+        while True:
+            # Waiting for a slot blocks, so do it off the event loop
+            await asyncio.to_thread(self._acquire, tokens)
+            try:
+                result = await coro_fn()
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.concurrency.release()
+            return result
+
+    def stats(self):
+        return {"retries": self.retries, "throttled": self.throttled, "concurrency_limit": int(self.concurrency.limit)}
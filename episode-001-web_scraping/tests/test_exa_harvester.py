@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+import pytest
+import ty_exa_script
+from exa_harvester import ExaHarvester, HarvestIndex, normalize_url
+from rate_limit import TokenBucket
+
+NUM_DOCUMENTS = 30
+RESULTS_PER_QUERY = 12
+CONTENTS_PAGE_SIZE = 5
+
+
+class StubExa:
+    # Stand-in for exa_py.Exa. "query N" finds documents 6N to 6N+11, so neighbouring queries overlap,
+    # under three different spellings of each URL. Documents 0 and 1 have the same text.
+    def __init__(self, num_documents=NUM_DOCUMENTS):
+        self.num_documents = num_documents
+        self.searches = []
+        self.contents_calls = []
+
+    def _url(self, doc, variant):
+        return [f"https://example.com/post/{doc}", f"http://www.example.com/post/{doc}/?utm_source=x",
+                f"https://EXAMPLE.com/post/{doc}?ref=feed"][variant % 3]
+
+    def search(self, query, num_results=10, **kwargs):
+        self.searches.append(query)
+        first = int(query.split()[-1]) * 6
+        docs = [(first + i) % self.num_documents for i in range(num_results)]
+        return SimpleNamespace(results=[SimpleNamespace(id=f"{doc}-{i}", url=self._url(doc, i)) for i, doc in enumerate(docs)])
+
+    def get_contents(self, ids, summary=None):
+        self.contents_calls.append(list(ids))
+        results = []
+        for result_id in ids:
+            doc, variant = (int(part) for part in result_id.split("-"))
+            text = f"Document {doc if doc > 1 else 0} text"
+            results.append(SimpleNamespace(url=self._url(doc, variant), text=text, summary=f"Summary of {text}"))
+        return SimpleNamespace(results=results)
+
+    def fetched_docs(self):
+        return [result_id.split("-")[0] for call in self.contents_calls for result_id in call]
+
+
+def harvest(index, queries):
+    exa = StubExa()
+    harvester = ExaHarvester(exa, index, results_per_query=RESULTS_PER_QUERY,
+                             contents_page_size=CONTENTS_PAGE_SIZE, requests_per_second=1000)
+    return exa, harvester.harvest(queries, "summarize")
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "exa_index.sqlite")
+
+
+def test_contents_are_fetched_a_page_at_a_time(index_path):
+    exa, _ = harvest(HarvestIndex(index_path), ["query 0"])
+    assert [len(call) for call in exa.contents_calls] == [5, 5, 2]
+
+
+def test_dedups_by_normalized_url_and_content(index_path):
+    exa, results = harvest(HarvestIndex(index_path), [f"query {i}" for i in range(5)])
+    # Every document is fetched once, whichever query and URL spelling found it
+    assert sorted(exa.fetched_docs(), key=int) == [str(doc) for doc in range(NUM_DOCUMENTS)]
+    # Documents 0 and 1 have the same text, only one of them is kept
+    assert len(results) == NUM_DOCUMENTS - 1
+    assert len({normalize_url(result.url) for result in results}) == NUM_DOCUMENTS - 1
+    assert normalize_url("http://www.Example.com/post/3/?utm_source=x&b=2&a=1") == "https://example.com/post/3?a=1&b=2"
+
+
+def test_next_run_only_fetches_new_documents(index_path):
+    queries = ["query 0", "query 1"]
+    index = HarvestIndex(index_path)
+    _, results = harvest(index, queries)
+    index.commit([normalize_url(result.url) for result in results])
+
+    # A new index on the same file, like the next run of the script
+    exa, results = harvest(HarvestIndex(index_path), queries + ["query 2"])
+    assert sorted(set(exa.fetched_docs()), key=int) == [str(doc) for doc in range(18, 24)]
+    assert len(results) == 6
+
+
+def test_uncommitted_documents_are_fetched_again(index_path):
+    # As if the run crashed before the training data was written
+    harvest(HarvestIndex(index_path), ["query 0"])
+    exa, results = harvest(HarvestIndex(index_path), ["query 0"])
+    assert len(exa.fetched_docs()) == RESULTS_PER_QUERY
+    assert len(results) == RESULTS_PER_QUERY - 1
+
+
+def test_query_is_expanded_and_every_variant_searched(monkeypatch, index_path):
+    # DSPy samples the variants, stubbed to return a duplicate and a blank one as well
+    completions = SimpleNamespace(optimized_prompt=["query 1", " query 2 ", "query 1", "", "query 0"])
+    fake_dspy = SimpleNamespace(ChainOfThought=lambda signature: lambda **kwargs: SimpleNamespace(completions=completions))
+    monkeypatch.setattr(ty_exa_script, "configure_dspy", lambda: fake_dspy)
+    monkeypatch.setitem(__import__("sys").modules, "dspy_programs", SimpleNamespace(OptimizeUserQuery=None))
+    assert ty_exa_script.get_query_variants("query 0", n=5) == ["query 0", "query 1", "query 2"]
+
+    exa = StubExa()
+    monkeypatch.setattr(ty_exa_script, "get_exa_client", lambda: exa)
+    monkeypatch.setattr(ty_exa_script, "get_harvest_index", lambda: HarvestIndex(index_path))
+    monkeypatch.setattr(ty_exa_script, "HARVEST_RESULTS_PER_QUERY", RESULTS_PER_QUERY)
+    results = ty_exa_script.harvest_exa_responses("query 0", "summarize", num_variants=5)
+    assert sorted(exa.searches) == ["query 0", "query 1", "query 2"]
+    # Documents 0 to 23, less the copy of document 0
+    assert len(results) == 23
+
+
+def test_harvesters_share_one_rate_limit(monkeypatch, index_path):
+    acquired = []
+    limiter = TokenBucket(rate=1000)
+    monkeypatch.setattr(limiter, "acquire", lambda tokens=1: acquired.append(tokens))
+    index = HarvestIndex(index_path)
+    for _ in range(2):
+        ExaHarvester(StubExa(), index, results_per_query=RESULTS_PER_QUERY,
+                     contents_page_size=CONTENTS_PAGE_SIZE, rate_limiter=limiter).harvest(["query 0"], "summarize")
+    # One search and three contents pages, then just the search (the documents are staged already)
+    assert len(acquired) == 4 + 1
+    assert ExaHarvester(StubExa(), HarvestIndex(index_path)).rate_limiter is not ty_exa_script.exa_rate_limiter
+    assert ty_exa_script.exa_rate_limiter.rate == ty_exa_script.EXA_REQUESTS_PER_SECOND
@@ -0,0 +1,24 @@
+import pytest
+from json_extract import extract_json
+
+
+def test_trailing_commas_and_smart_quotes_outside_strings():
+    assert extract_json('Here you go: {“name”: “Bob”, "tags": ["a", "b",],}') == {"name": "Bob", "tags": ["a", "b"]}
+
+
+def test_string_values_are_left_alone():
+    text = '```json\n{"quote": "It’s “fine”, ]", "list": "a, }",}\n```'
+    assert extract_json(text) == {"quote": "It’s “fine”, ]", "list": "a, }"}
+
+
+def test_plain_quotes_inside_smart_quoted_strings():
+    assert extract_json('{“title”: “The "best" one”,}') == {"title": 'The "best" one'}
+
+
+def test_python_literals():
+    assert extract_json("{'done': True, 'note': 'a, ]', 'value': None,}") == {"done": True, "note": "a, ]", "value": None}
+
+
+def test_deeply_nested_input_is_a_value_error():
+    with pytest.raises(ValueError):
+        extract_json("[" * 100000 + "]" * 99999)
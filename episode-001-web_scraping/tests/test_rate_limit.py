@@ -0,0 +1,121 @@
+import json
+import time
+import threading
+import urllib.error
+import urllib.request
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from rate_limit import ProviderLimiter, get_retry_after
+from providers import LimitedLM
+from llm_cache import ResponseCache, CachedLM
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    # Answers each request with the next queued (status, headers) response, 200 once the queue is empty
+    def do_POST(self):
+        server = self.server
+        server.request_times.append(time.time())
+        status, headers = server.responses.pop(0) if server.responses else (200, {})
+        body = json.dumps({"completion": "ok"} if status == 200 else {"error": "rate limited"}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAPIHandler)
+    server.responses = []
+    server.request_times = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1/complete"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, prompt):
+    request = urllib.request.Request(url, data=json.dumps({"prompt": prompt}).encode(), method="POST")
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())["completion"]
+
+
+class HttpLM:
+    # Stand-in for a DSPy LM that talks to the fake API
+    def __init__(self, url):
+        self.url = url
+        self.kwargs = {"model": "fake-model", "temperature": 0.2, "max_tokens": 64}
+        self.calls = 0
+
+    def __call__(self, prompt, **kwargs):
+        self.calls += 1
+        return [post(self.url, prompt)]
+
+
+def test_waits_for_retry_after_seconds(api):
+    api.responses = [(429, {"Retry-After": "1"})]
+    limiter = ProviderLimiter(max_concurrency=4)
+    assert limiter.call(lambda: post(api.url, "hello")) == "ok"
+    assert len(api.request_times) == 2
+    assert api.request_times[1] - api.request_times[0] >= 0.9
+    assert limiter.retries == 1 and limiter.throttled == 1
+
+
+def test_waits_for_retry_after_http_date(api):
+    # HTTP dates only have whole seconds, two seconds from now is at least one second away
+    api.responses = [(429, {"Retry-After": formatdate(time.time() + 2, usegmt=True)})]
+    limiter = ProviderLimiter(max_concurrency=4)
+    assert limiter.call(lambda: post(api.url, "hello")) == "ok"
+    assert len(api.request_times) == 2
+    assert api.request_times[1] - api.request_times[0] >= 0.9
+
+
+def test_gives_up_after_max_retries(api):
+    api.responses = [(429, {"Retry-After": "0"})] * 3
+    limiter = ProviderLimiter(max_retries=2)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        limiter.call(lambda: post(api.url, "hello"))
+    assert error.value.code == 429
+    assert len(api.request_times) == 3
+
+
+def test_retry_after_forms():
+    class Error(Exception):
+        def __init__(self, value):
+            self.headers = {"retry-after": value}
+
+    assert get_retry_after(Error("7")) == 7.0
+    assert 0 < get_retry_after(Error(formatdate(time.time() + 30, usegmt=True))) <= 30
+    assert get_retry_after(Error(formatdate(time.time() - 30, usegmt=True))) == 0.0
+    assert get_retry_after(Error("soon")) is None
+
+
+def test_dspy_lm_calls_go_through_the_limiter(api):
+    api.responses = [(429, {"Retry-After": "0"}), (503, {"Retry-After": "0"})]
+    limiter = ProviderLimiter(max_concurrency=4)
+    lm = LimitedLM(HttpLM(api.url), limiter)
+    assert lm("hello") == ["ok"]
+    assert lm.kwargs["model"] == "fake-model"
+    assert len(api.request_times) == 3
+    assert limiter.retries == 2 and limiter.throttled == 1
+
+
+def test_cache_hits_skip_the_limiter(api, tmp_path):
+    http_lm = HttpLM(api.url)
+    cache = ResponseCache(path=str(tmp_path / "cache.sqlite"))
+    lm = CachedLM(LimitedLM(http_lm, ProviderLimiter()), cache)
+    assert lm("hello") == ["ok"]
+    assert lm("hello") == ["ok"]
+    assert http_lm.calls == 1 and len(api.request_times) == 1
+    # Same key as without the limiter, so existing cache entries still hit
+    assert CachedLM(http_lm, cache)("hello") == ["ok"]
+    assert http_lm.calls == 1
@@ -0,0 +1,94 @@
+import os
+import json
+
+
+class TrainingDataWriter:
+    # Appends each user/assistant pair to a .partial file as soon as it's generated, and only
+    # produces the final training file (with the system prompt) once finalize() is called.
+    def __init__(self, final_path, fsync_every=20, resume=False):
+        self.final_path = final_path
+        self.partial_path = final_path + ".partial"
+        self.fsync_every = fsync_every
+        self.done_keys = set()
+        self.count = 0
+        self._unsynced = 0
+
+        if resume and os.path.exists(self.partial_path):
+            self._drop_truncated_line()
+            for record in self.iter_records():
+                self.done_keys.add(record.get("key"))
+                self.count += 1
+            self._file = open(self.partial_path, "a", encoding="utf-8")
+        else:
+            self._file = open(self.partial_path, "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def is_done(self, key):
+        return key is not None and key in self.done_keys
+
+    def write(self, user, assistant, key=None, system=None):
+        # `system` is only needed when records have different system prompts (e.g. batch runs)
+        record = {"key": key, "user": user, "assistant": assistant}
+        if system is not None:
+            record["system"] = system
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self.done_keys.add(key)
+        self.count += 1
+        self._unsynced += 1
+        # fsync in batches, one per record would make the disk the bottleneck
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _drop_truncated_line(self):
+        # A crash mid-write can leave a partial last line, cut it off before appending to the file
+        with open(self.partial_path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                f.truncate(end)
+
+    def iter_records(self):
+        with open(self.partial_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def finalize(self, system_prompt=None):
+        # Write the final file next to it and rename, so it's either complete or not there at all
+        self.sync()
+        self._file.close()
+        tmp_path = self.final_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self.iter_records():
+                entry = {
+                    "messages": [
+                        {"role": "system", "content": record.get("system", system_prompt)},
+                        {"role": "user", "content": record["user"]},
+                        {"role": "assistant", "content": record["assistant"]}
+                    ]
+                }
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.final_path)
+        os.remove(self.partial_path)
+        return self.final_path
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
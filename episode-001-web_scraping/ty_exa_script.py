@@ -1,12 +1,18 @@
 import os
 import time
 import json
-import dspy
-from dspy.teleprompt import BootstrapFewShot
-from exa_py import Exa
-from anthropic import Anthropic
-from openai import OpenAI
-import ollama
+import hashlib
+import argparse
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from llm_cache import ResponseCache, CachedLM, make_cache_key
+from training_writer import TrainingDataWriter
+from exa_harvester import ExaHarvester, HarvestIndex, normalize_url, content_hash
+from rate_limit import TokenBucket
+from providers import get_provider, LimitedLM
+from json_extract import extraction_stats
+from pipeline import Pipeline, Stage
 
 
 LLM_PROVIDER = "anthropic"
@@ -21,90 +27,177 @@ OPENAI_CHEAP_MODEL = "gpt-4o-mini"
 OLLAMA_MODEL = "llama3.1"
 # Number of results to return from Exa
 NUM_EXA_RESULTS = 5
+# Expand the query into variants and harvest only new documents for all of them (instead of a single search)
+USE_EXA_HARVESTER = False
+# Number of query variants to generate from the optimized query when harvesting
+NUM_QUERY_VARIANTS = 5
+# Results to request per query variant, and how many contents requests to make at once
+HARVEST_RESULTS_PER_QUERY = 25
+HARVEST_MAX_CONCURRENCY = 4
+# Max Exa requests per second across all harvester threads
+EXA_REQUESTS_PER_SECOND = 5
+# Persistent index of already harvested documents, so repeat runs only fetch new ones
+EXA_INDEX_PATH = os.path.expanduser("~/.cache/tool-use/exa_index.sqlite")
+# Max number of LLM calls in flight at once when generating training data (1 = run sequentially)
+MAX_CONCURRENT_LLM_CALLS = 8
+# Cache LLM responses on disk so reruns with identical prompts don't pay again
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = os.path.expanduser("~/.cache/tool-use/llm_cache.sqlite")
+# Max age (seconds) and max number of cached responses before eviction
+LLM_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+LLM_CACHE_MAX_ENTRIES = 20000
+# Fixed name for the training data file, needed to resume an interrupted run (None = use a timestamp)
+TRAINING_DATA_RUN_NAME = None
+# Resume from the .partial file of TRAINING_DATA_RUN_NAME, skipping results that are already on disk
+RESUME_TRAINING_DATA = False
+# Number of records written between fsyncs of the training data file
+TRAINING_DATA_FSYNC_EVERY = 20
+# Max queries in each stage at once when running a batch of queries (optimize -> summary prompt -> search -> generate)
+BATCH_OPTIMIZE_CONCURRENCY = 4
+BATCH_SUMMARY_PROMPT_CONCURRENCY = 4
+BATCH_SEARCH_CONCURRENCY = 2
+BATCH_GENERATE_CONCURRENCY = 2
+# Seconds between progress reports in batch mode
+BATCH_REPORT_EVERY = 30
+# Where compiled DSPy programs are saved, so they're only compiled once
+DSPY_COMPILED_DIR = os.path.expanduser("~/.cache/tool-use/dspy_compiled")
+# Simulated latency (seconds) for the local fake provider, used for benchmarking
+FAKE_LLM_LATENCY = 0.5
+
+# Every harvester takes its Exa requests from this one bucket, batch mode runs several searches at once
+exa_rate_limiter = TokenBucket(rate=EXA_REQUESTS_PER_SECOND)
+
+# Shared response cache, used by get_llm_response and the DSPy lm
+llm_cache = ResponseCache(path=LLM_CACHE_PATH, max_age=LLM_CACHE_MAX_AGE, max_entries=LLM_CACHE_MAX_ENTRIES)
+
+# DSPy, Exa and the provider SDKs are slow to import, so they're only imported (and configured) on first use
+_exa_client = None
+_harvest_index = None
+_dspy_configured = False
+_dspy_lock = threading.Lock()
+# Compiled DSPy programs already loaded in this process, by compile key
+_compiled_optimizers = {}
+_compiled_optimizers_lock = threading.Lock()
+
+
+def get_exa_client():
+    global _exa_client
+    if _exa_client is None:
+        from exa_py import Exa
+        _exa_client = Exa(api_key=os.getenv("EXA_API_KEY"))
+    return _exa_client
+
+
+def get_harvest_index():
+    # One index per process, documents staged by a harvest are committed once their training data is written
+    global _harvest_index
+    if _harvest_index is None:
+        _harvest_index = HarvestIndex(EXA_INDEX_PATH)
+    return _harvest_index
+
+
+def get_dspy_model():
+    return {"openai": OPENAI_SOTA_MODEL, "anthropic": ANTHROPIC_CHEAP_MODEL, "ollama": OLLAMA_MODEL}.get(LLM_PROVIDER)
+
+
+def configure_dspy():
+    global _dspy_configured
+    # Set DSP_CACHEBOOL environment variable to False to disable DSPy's own caching, llm_cache handles it instead.
+    # It has to be set before dspy is imported to take effect.
+    os.environ['DSP_CACHEBOOL'] = 'False'
+    os.environ["DSP_CACHEDIR"] = ""
+    import dspy
+    with _dspy_lock:
+        if not _dspy_configured:
+            if LLM_PROVIDER == "openai":
+                llm = dspy.OpenAI(model=get_dspy_model(),  max_tokens=2048, temperature=0.2)
+            elif LLM_PROVIDER == "anthropic":
+                llm = dspy.Claude(model=get_dspy_model(), max_tokens=2048, temperature=0.2)
+            elif LLM_PROVIDER == "ollama":
+                llm = dspy.OllamaLocal(model=get_dspy_model())
+            else:
+                raise ValueError(f"DSPy is not supported with the '{LLM_PROVIDER}' provider")
+            # Inside the cache, so cache hits don't use up the provider's budget
+            llm = LimitedLM(llm, get_llm_provider().limiter)
+            if LLM_CACHE_ENABLED:
+                llm = CachedLM(llm, llm_cache)
+            dspy.settings.configure(lm=llm)
+            _dspy_configured = True
+    return dspy
+
+
+
+
+
+def resolve_model(model):
+    # Map the 'cheap' / 'sota' aliases to the model name for the current provider
+    if LLM_PROVIDER == "openai":
+        return {"cheap": OPENAI_CHEAP_MODEL, "sota": OPENAI_SOTA_MODEL}.get(model, model)
+    if LLM_PROVIDER == "anthropic":
+        return {"cheap": ANTHROPIC_CHEAP_MODEL, "sota": ANTHROPIC_SOTA_MODEL}.get(model, model)
+    if LLM_PROVIDER == "ollama":
+        return OLLAMA_MODEL
+    return model
 
-# Configure Exa
-exa_api_key = os.getenv("EXA_API_KEY")
-exa = Exa(api_key=exa_api_key)
-# Initialize Anthropic client
-anthropic_client = Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-# Configure DSPy 
-if LLM_PROVIDER == "openai":
-    llm = dspy.OpenAI(model=OPENAI_SOTA_MODEL,  max_tokens=2048, temperature=0.2)
-elif LLM_PROVIDER == "anthropic":
-    llm = dspy.Claude(model=ANTHROPIC_CHEAP_MODEL, max_tokens=2048, temperature=0.2)
-elif LLM_PROVIDER == "ollama":
-    llm = dspy.OllamaLocal(model=OLLAMA_MODEL)
-dspy.settings.configure(lm=llm)
-# Set DSP_CACHEBOOL environment variable to False to disable caching
-os.environ['DSP_CACHEBOOL'] = 'False'
-os.environ["DSP_CACHEDIR"] = ""
 
+def get_llm_provider():
+    # Provider clients are created on first use and reused for every call after that
+    options = {"latency": FAKE_LLM_LATENCY} if LLM_PROVIDER == "fake" else {}
+    return get_provider(LLM_PROVIDER, **options)
 
 
+def get_llm_response(prompt, model='cheap', temperature=0.2, max_tokens=2024, use_cache=True):
+    model = resolve_model(model)
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cache_key = make_cache_key(LLM_PROVIDER, model, prompt, temperature, max_tokens)
+        cached_response = llm_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
 
+    response = get_llm_provider().complete(prompt, model, temperature=temperature, max_tokens=max_tokens)
 
-def get_llm_response(prompt, model='cheap'):
-    
-    if LLM_PROVIDER == "ollama":
-        response = ollama.chat(model=OLLAMA_MODEL, messages=[
-        {
-            'role': 'user',
-            'content': prompt,
-        },
-        ])
-        print(response['message']['content'])
-    if LLM_PROVIDER == "openai":
-        if model == 'cheap':
-            model = OPENAI_CHEAP_MODEL
-        elif model == 'sota':
-            model = OPENAI_SOTA_MODEL
-        response = openai_client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model=model,
-            max_tokens=2024,
-            temperature=0.2,
-            stop=None,
-        )
-        return response.choices[0].message.content
-    
-    elif LLM_PROVIDER == "anthropic":
-        if model == 'cheap':
-            model = ANTHROPIC_CHEAP_MODEL
-        elif model == 'sota':
-            model = ANTHROPIC_SOTA_MODEL
-        message = anthropic_client.messages.create(
-            max_tokens=2024,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model=model,
-        )
-        
-        return message.content[0].text if isinstance(message.content, list) else message.content
+    if use_cache and response is not None:
+        llm_cache.set(cache_key, response)
+    return response
 
 
-# Define the DSPy signature for prompt optimization
-class OptimizeUserQuery(dspy.Signature):
-    """Based on the user query, enhance the user query to add context, and make it more useful for an AI assistant"""
-    user_prompt = dspy.InputField()
-    optimized_prompt = dspy.OutputField()
+def get_llm_json_response(prompt, schema, model='cheap', temperature=0.2, max_tokens=2024, use_cache=True):
+    # Like get_llm_response, but returns a parsed JSON object matching `schema`
+    model = resolve_model(model)
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cache_key = make_cache_key(LLM_PROVIDER, model, prompt, temperature, max_tokens, schema=schema)
+        cached_response = llm_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
+
+    response = get_llm_provider().complete_json(prompt, model, schema, temperature=temperature, max_tokens=max_tokens)
+
+    if use_cache and response is not None:
+        llm_cache.set(cache_key, response)
+    return response
+
+
+async def get_llm_response_async(prompt, model='cheap', temperature=0.2, max_tokens=2024, use_cache=True):
+    model = resolve_model(model)
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cache_key = make_cache_key(LLM_PROVIDER, model, prompt, temperature, max_tokens)
+        cached_response = llm_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
+
+    response = await get_llm_provider().acomplete(prompt, model, temperature=temperature, max_tokens=max_tokens)
+
+    if use_cache and response is not None:
+        llm_cache.set(cache_key, response)
+    return response
 
-# Create a DSPy module to optimize the prompt
-class UserQueryOptimizer(dspy.Module):
-    def __init__(self):
-        super().__init__()
-        self.optimize = dspy.ChainOfThought(OptimizeUserQuery)
 
-    def forward(self, user_prompt):
-        optimized = self.optimize(user_prompt=user_prompt)
-        return optimized.optimized_prompt
-    
-    
 def run_dspy_user_query_optimizer(user_prompt):
+    configure_dspy()
+    from dspy_programs import UserQueryOptimizer
     
     # Create an instance of the UserQueryOptimizer class
     user_query_optimizer = UserQueryOptimizer()
@@ -118,47 +211,66 @@ def run_dspy_user_query_optimizer(user_prompt):
 
 
 
-# Define the DSPy signature for prompt optimization
-class OptimizePrompt(dspy.Signature):
-    """Based on the user query, generate a summary prompt to create a useful prompt for an AI assistant that will summarize a website. The summary prompt should be formatted in a way that it can be used as an input to the AI assistant, and should be themed around the user query. The summary prompt should be formatted as a single string, with no line breaks or other formatting. The summary prompt should be at least 5-7 sentences long, but no more than 8 sentences. Remember, this should be a prompt for an AI assistant, write in in the format of a LLM prompt.  IMPORTANT: Do NOT talk about the website, only the contents of the website.  Only include information about the content of the website, avoid language like: "This article..." or "This page..."""
-    user_prompt = dspy.InputField()
-    optimized_prompt = dspy.OutputField()
-
-# Create a DSPy module to optimize the prompt
-class SummaryPromptOptimizer(dspy.Module):
-    def __init__(self):
-        super().__init__()
-        self.optimize = dspy.ChainOfThought(OptimizePrompt)
-
-    def forward(self, user_prompt):
-        optimized = self.optimize(user_prompt=user_prompt)
-        return dspy.Prediction(optimized_prompt=optimized.optimized_prompt)
+# Examples of great summarizer prompts, used to compile the SummaryPromptOptimizer
+SUMMARY_PROMPT_EXAMPLES = [
+    {
+        "user_prompt": "What are the most interesting AI startups? What makes them great startups?",
+        "optimized_prompt": """Summarize the website to get the general idea of what the company does, summarize it in a format to highlight how unique the startup is. Basically an elevator pitch. Something like: \"Paradox AI - the AI assistant for recruiting. Paradox makes it easy to find great candidates using the power of AI. It works by ....\" and so on. At the end of the response, showcase WHY this idea is important. And why it would make a great startup from both the innovation and business standpoint. Ideally 5-7 sentences. Only include information about the content of the website, avoid language like: "This article..." or "This page..."""
+    },
+    {
+        "user_prompt": "What are some of the best traditional apple pie recipes that are beginner-friendly and include cinnamon and Granny Smith apples?",
+        "optimized_prompt": "Summarize the website that features beginner-friendly traditional apple pie recipes, specifically those that include cinnamon and Granny Smith apples. Focus on the simplicity of the instructions and the common ingredients that make these recipes accessible for novice bakers. Highlight the importance of flavor balance and texture in creating a delicious apple pie. Include tips for preparation and baking that can help beginners achieve the best results. Provide a list of recommended toppings and variations to add to the pie. The summary should be at least 5-7 sentences long, but no more than 8 sentences. Only include information about the content of the website, avoid talking about how the information is on a website\""
+    },
+]
+
+
+def get_compiled_summary_prompt_optimizer():
+    # Compiling runs the examples through the LLM, so the compiled program is saved to disk and reused
+    # for as long as the examples, the signature and the model stay the same
+    dspy = configure_dspy()
+    from dspy.teleprompt import BootstrapFewShot
+    from dspy_programs import SummaryPromptOptimizer, OptimizePrompt
+
+    compile_key = hashlib.sha256(json.dumps({
+        "examples": SUMMARY_PROMPT_EXAMPLES,
+        "signature": OptimizePrompt.__doc__,
+        "provider": LLM_PROVIDER,
+        "model": get_dspy_model(),
+    }, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    with _compiled_optimizers_lock:
+        if compile_key in _compiled_optimizers:
+            return _compiled_optimizers[compile_key]
+
+        compiled_path = os.path.join(DSPY_COMPILED_DIR, f"summary_prompt_optimizer_{compile_key}.json")
+        # Create an instance of the SummaryPromptOptimizer class
+        summary_prompt_optimizer = SummaryPromptOptimizer()
+
+        if os.path.exists(compiled_path):
+            summary_prompt_optimizer.load(compiled_path)
+            compiled_optimizer = summary_prompt_optimizer
+            print(f"\n♻️  Loaded compiled summary prompt optimizer from {compiled_path}\n")
+        else:
+            # Create a list of examples of great summarizer prompts
+            examples = [dspy.Example(**example).with_inputs("user_prompt") for example in SUMMARY_PROMPT_EXAMPLES]
+            
+            # Create a teleprompter (optimizer) instance
+            teleprompter = BootstrapFewShot(metric=lambda example, pred, trace=None: True)
+            
+            # Compile the teleprompter with the summary_prompt_optimizer and the examples
+            compiled_optimizer = teleprompter.compile(summary_prompt_optimizer, trainset=examples)
 
+            # Save to a temp file and rename, so a crash never leaves a half written program behind
+            os.makedirs(DSPY_COMPILED_DIR, exist_ok=True)
+            compiled_optimizer.save(compiled_path + ".tmp")
+            os.replace(compiled_path + ".tmp", compiled_path)
 
+        _compiled_optimizers[compile_key] = compiled_optimizer
+        return compiled_optimizer
 
 
 def run_dspy_summarizer_prompt_optimizer(user_prompt):
-    
-    # Create a list of examples of great summarizer prompts
-    examples = [
-        dspy.Example(
-            user_prompt="What are the most interesting AI startups? What makes them great startups?",
-            optimized_prompt= """Summarize the website to get the general idea of what the company does, summarize it in a format to highlight how unique the startup is. Basically an elevator pitch. Something like: \"Paradox AI - the AI assistant for recruiting. Paradox makes it easy to find great candidates using the power of AI. It works by ....\" and so on. At the end of the response, showcase WHY this idea is important. And why it would make a great startup from both the innovation and business standpoint. Ideally 5-7 sentences. Only include information about the content of the website, avoid language like: "This article..." or "This page..."""
-        ).with_inputs("user_prompt"),
-        dspy.Example(
-            user_prompt="What are some of the best traditional apple pie recipes that are beginner-friendly and include cinnamon and Granny Smith apples?",
-            optimized_prompt= "Summarize the website that features beginner-friendly traditional apple pie recipes, specifically those that include cinnamon and Granny Smith apples. Focus on the simplicity of the instructions and the common ingredients that make these recipes accessible for novice bakers. Highlight the importance of flavor balance and texture in creating a delicious apple pie. Include tips for preparation and baking that can help beginners achieve the best results. Provide a list of recommended toppings and variations to add to the pie. The summary should be at least 5-7 sentences long, but no more than 8 sentences. Only include information about the content of the website, avoid talking about how the information is on a website\""
-        ).with_inputs("user_prompt"),
-    ]
-    
-    # Create an instance of the SummaryPromptOptimizer class
-    summary_prompt_optimizer = SummaryPromptOptimizer()
-    
-    # Create a teleprompter (optimizer) instance
-    teleprompter = BootstrapFewShot(metric=lambda example, pred, trace=None: True)
-    
-    # Compile the teleprompter with the summary_prompt_optimizer and the examples
-    compiled_optimizer = teleprompter.compile(summary_prompt_optimizer, trainset=examples)
+    compiled_optimizer = get_compiled_summary_prompt_optimizer()
 
     # Call the forward method of the SummaryPromptOptimizer class with the user_prompt as argument
     result = compiled_optimizer(user_prompt=user_prompt)
@@ -173,7 +285,7 @@ def run_dspy_summarizer_prompt_optimizer(user_prompt):
 
 
 def get_exa_responses(search_query, summary_prompt):
-    result = exa.search_and_contents(
+    result = get_exa_client().search_and_contents(
         search_query,
         type="neural",
         use_autoprompt=True,
@@ -186,114 +298,297 @@ def get_exa_responses(search_query, summary_prompt):
     return result.results
 
 
+def get_query_variants(user_prompt, n=NUM_QUERY_VARIANTS):
+    # Sample several optimized queries for the same prompt, the seed query always comes first
+    dspy = configure_dspy()
+    from dspy_programs import OptimizeUserQuery
+    optimize = dspy.ChainOfThought(OptimizeUserQuery)
+    prediction = optimize(user_prompt=user_prompt, config=dict(n=n, temperature=0.7))
+    variants = [user_prompt]
+    for variant in prediction.completions.optimized_prompt:
+        variant = variant.strip()
+        if variant and variant not in variants:
+            variants.append(variant)
+    print(f"\n\n🌱 \033[94mGenerated {len(variants) - 1} query variants\033[0m\n")
+    return variants
+
+
+def harvest_exa_responses(search_query, summary_prompt, num_variants=NUM_QUERY_VARIANTS):
+    queries = get_query_variants(search_query, n=num_variants) if num_variants > 1 else [search_query]
+    harvester = ExaHarvester(
+        get_exa_client(),
+        get_harvest_index(),
+        results_per_query=HARVEST_RESULTS_PER_QUERY,
+        max_concurrency=HARVEST_MAX_CONCURRENCY,
+        rate_limiter=exa_rate_limiter,
+    )
+    results = harvester.harvest(queries, summary_prompt)
+    print(f"\n\n🌾 Harvested {len(results)} new documents from {len(queries)} queries, {len(harvester.index)} in the index\n")
+    return results
+
+
 
-def generate_training_data(exa_responses):
+def generate_likely_user_query(ai_assistant_result):
+    # Rate limits and transient errors are retried by the provider, anything that still fails only
+    # skips this one result instead of throwing away the rest of the batch
     try:
-        all_data = []
-        for i, response in enumerate(exa_responses, 1):
-            ai_assistant_result = response.summary
-            likely_user_query = get_llm_response(prompt=f"""
-                Given the following result from an AI assistant, provide ONE example of what user query was likely used to get this result. Respond ONLY with the user query.
-                
-                AI Assistant Result: {ai_assistant_result}                    
-            """, model="cheap")
-            
+        return get_llm_response(prompt=f"""
+            Given the following result from an AI assistant, provide ONE example of what user query was likely used to get this result. Respond ONLY with the user query.
             
-            all_data.append({
-                "user": likely_user_query,
-                "assistant": ai_assistant_result
-            })
-            
-            # Pretty print the results
-            print(f"\n🔎 \033[95mExa Response {i}:\n{response.summary.strip()}\033[0m\n")
-            print(f"\n🤖 \033[92mGenerated likely user query:\n {likely_user_query}\033[0m\n")
+            AI Assistant Result: {ai_assistant_result}                    
+        """, model="cheap")
+    except Exception as e:
+        print(f"Error: Failed to generate user query: {str(e)}")
+        return None
 
-            print("-" * 50)  # Separator between responses
-        if len(all_data) == 0:
-                print("No data found, please try again with more exa responses")
-                return
-        n = 3
-        if len(all_data) < 3:
-            n = len(all_data)
 
-        first_n_data = all_data[:n]
-        
-        formatted_data = "\n".join([f"User: {item['user']}\nAssistant: {item['assistant']}\n" for item in first_n_data])
+def generate_likely_user_queries(exa_responses, max_concurrency=MAX_CONCURRENT_LLM_CALLS):
+    # Yields the user queries in the same order as the exa responses, as soon as each one is ready
+    summaries = [response.summary for response in exa_responses]
+    if max_concurrency <= 1:
+        yield from map(generate_likely_user_query, summaries)
+        return
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        yield from executor.map(generate_likely_user_query, summaries)
 
-        sys_prompt_gen_prompt = f"""
-            Given the conversation between a user and an AI assistant below, create a system prompt that was most likely used to get the assistant's response. The system prompt should be formatted in a way that it can be used as an input to the AI assistant, and should be themed around the user query. Remember: system prompts are usually fairly general, and not specific. The system prompt should be formatted as a single string, with no line breaks or other formatting. The system prompt should be between 1-3 sentences long. Provide your response in valid JSON format, like this: {{"prompt": "YOUR_PROMPT_HERE"}}. Do NOT provide any other information.
-            
-            Conversation:
-            {formatted_data}
-            """
-            
-        # Generate the system prompt using Anthropic's API, but lets make sure it's valid JSON and has a 'prompt' key
-        max_attempts = 4
-        for attempt in range(max_attempts):
-            try:
-                generated_system_prompt = get_llm_response(prompt=sys_prompt_gen_prompt, model="sota")
-                generated_system_prompt = json.loads(generated_system_prompt)
-                
-                if "prompt" in generated_system_prompt:
-                    generated_system_prompt = generated_system_prompt["prompt"]
-                    break  # If successful, exit the loop
-                else:
-                    print("Error: Generated system prompt is not valid JSON, trying again...")
+
+def get_training_data_path(run_name=None):
+    # Generate a jsonl file with the required format, save it to the downloads folder
+    downloads_folder = os.path.expanduser("~/Downloads")
+    # Add a timestamp to the file name if no run name was given
+    run_name = run_name or time.strftime("%m-%d-%Y-%H:%M")
+    return os.path.join(downloads_folder, f"training_data_{run_name}.jsonl")
+
+
+# JSON schema of the generated system prompt
+SYSTEM_PROMPT_SCHEMA = {
+    "type": "object",
+    "properties": {"prompt": {"type": "string", "description": "The system prompt"}},
+    "required": ["prompt"],
+}
+
+
+def generate_system_prompt(first_n_data):
+    formatted_data = "\n".join([f"User: {item['user']}\nAssistant: {item['assistant']}\n" for item in first_n_data])
+
+    sys_prompt_gen_prompt = f"""
+        Given the conversation between a user and an AI assistant below, create a system prompt that was most likely used to get the assistant's response. The system prompt should be formatted in a way that it can be used as an input to the AI assistant, and should be themed around the user query. Remember: system prompts are usually fairly general, and not specific. The system prompt should be formatted as a single string, with no line breaks or other formatting. The system prompt should be between 1-3 sentences long. Provide your response in valid JSON format, like this: {{"prompt": "YOUR_PROMPT_HERE"}}. Do NOT provide any other information.
+    
+        Conversation:
+        {formatted_data}
+        """
+    
+    # Generate the system prompt as structured output, malformed JSON is repaired locally so a retry is rarely needed
+    max_attempts = 2
+    for attempt in range(max_attempts):
+        try:
+            generated_system_prompt = get_llm_json_response(prompt=sys_prompt_gen_prompt, schema=SYSTEM_PROMPT_SCHEMA, model="sota", use_cache=attempt == 0)
+            if isinstance(generated_system_prompt, dict) and generated_system_prompt.get("prompt"):
+                return generated_system_prompt["prompt"]
+            print("Error: Generated system prompt is missing the 'prompt' key, trying again...")
+        except ValueError as e:
+            print(f"Attempt {attempt + 1} failed: {str(e)}")
+    raise ValueError(f"Failed to generate a valid system prompt after {max_attempts} attempts.")
+
+
+def generate_training_data(exa_responses, max_concurrency=MAX_CONCURRENT_LLM_CALLS, run_name=None, resume=False):
+    try:
+        file_path = get_training_data_path(run_name)
+        writer = TrainingDataWriter(file_path, fsync_every=TRAINING_DATA_FSYNC_EVERY, resume=resume)
+    except Exception as e:
+        print(f"\n\n❌ Error making training data: {str(e)}")
+        return
+    
+    with writer:
+        try:
+            if writer.count:
+                print(f"\n♻️  Resuming from {writer.partial_path}, {writer.count} results already on disk\n")
+            # Skip results that were already generated in a previous run
+            pending_responses = [response for response in exa_responses if not writer.is_done(normalize_url(response.url))]
+            likely_user_queries = generate_likely_user_queries(pending_responses, max_concurrency=max_concurrency)
+            for i, (response, likely_user_query) in enumerate(zip(pending_responses, likely_user_queries), 1):
+                if likely_user_query is None:
+                    print(f"\nSkipping Exa Response {i}, no user query could be generated\n")
                     continue
                 
-            except:
-                if attempt < max_attempts - 1:  # If not the last attempt
-                    print(f"Attempt {attempt + 1} failed: Generated system prompt is not valid JSON, trying again...")
-                else:
-                    print(f"Error: Failed to generate valid JSON after {max_attempts} attempts.")
-                    raise  # Re-raise the last exception if all attempts fail
-        
-        print(f"\n👽 \033[96mGenerated likely system prompt:\n {generated_system_prompt}\033[0m\n")
+                # Append straight to disk, so a later failure doesn't lose the generations we paid for
+                writer.write(user=likely_user_query, assistant=response.summary, key=normalize_url(response.url))
+                
+                # Pretty print the results
+                print(f"\n🔎 \033[95mExa Response {i}:\n{response.summary.strip()}\033[0m\n")
+                print(f"\n🤖 \033[92mGenerated likely user query:\n {likely_user_query}\033[0m\n")
+
+                print("-" * 50)  # Separator between responses
+            # The harvested documents only go in the index once their examples are safely on disk
+            if USE_EXA_HARVESTER:
+                writer.sync()
+                get_harvest_index().commit([normalize_url(response.url) for response in exa_responses if writer.is_done(normalize_url(response.url))])
+            if writer.count == 0:
+                print("No data found, please try again with more exa responses")
+                return
+            # Only the first few examples are needed to generate the system prompt
+            first_n_data = list(islice(writer.iter_records(), 3))
         
+            generated_system_prompt = generate_system_prompt(first_n_data)
+            print(f"\n👽 \033[96mGenerated likely system prompt:\n {generated_system_prompt}\033[0m\n")
         
-        # Generate a jsonl file with the required format, save it to the downloads folder
-        downloads_folder = os.path.expanduser("~/Downloads")
-        # Add a timestamp to the file name
-        current_time = time.strftime("%m-%d-%Y-%H:%M")
-        file_name = f"training_data_{current_time}.jsonl"
-        file_path = os.path.join(downloads_folder, file_name)
         
-        with open(file_path, "w") as f:
-            for item in all_data:
-                entry = {
-                    "messages": [
-                        {"role": "system", "content": generated_system_prompt},
-                        {"role": "user", "content": item["user"]},
-                        {"role": "assistant", "content": item["assistant"]}
-                    ]
-                }
-                f.write(json.dumps(entry) + "\n")
-
-        print(f"\n\n📝 \033[38;5;218mGenerated training data saved to {file_path}\033[0m\n\n")
-    except Exception as e:
-        print(f"\n\n❌ Error making training data: {str(e)}")
-        return
+            file_path = writer.finalize(generated_system_prompt)
+            print(f"\n\n📝 \033[38;5;218mGenerated training data saved to {file_path}\033[0m\n\n")
+        except Exception as e:
+            print(f"\n\n❌ Error making training data: {str(e)}")
+            print(f"Generated results so far are saved in {writer.partial_path}, rerun with the same run name and resume=True to continue")
+            return
+
+def load_queries(queries_path):
+    # One query per line, blank lines and lines starting with # are skipped, duplicates are dropped
+    queries = []
+    with open(queries_path, "r", encoding="utf-8") as f:
+        for line in f:
+            query = line.strip()
+            if query and not query.startswith("#") and query not in queries:
+                queries.append(query)
+    return queries
+
+
+def run_batch(queries_path, run_name=None, resume=False):
+    queries = load_queries(queries_path)
+    print(f"\n📚 Running {len(queries)} queries from {queries_path}\n")
+
+    # DSPy settings only carry over to worker threads when configured on the main thread, and the
+    # summary prompt optimizer should be compiled once before any workers need it
+    configure_dspy()
+    get_compiled_summary_prompt_optimizer()
+
+    file_path = get_training_data_path(run_name or f"batch_{time.strftime('%m-%d-%Y-%H:%M')}")
+    writer = TrainingDataWriter(file_path, fsync_every=TRAINING_DATA_FSYNC_EVERY, resume=resume)
+    # Results are deduplicated across all queries, by normalized URL and by content. `written` has the keys
+    # of the records on disk, `claimed` those of results a query still in the pipeline is working on. A claim
+    # is released when its query finishes or fails, so results that weren't written can be used by another.
+    written = set(writer.done_keys)
+    for record in writer.iter_records():
+        written.add(content_hash(record["assistant"]))
+    claimed = set()
+    claims_lock = threading.Lock()
+
+    def claim_new(job, exa_responses):
+        new_responses = []
+        job["claimed"] = []
+        with claims_lock:
+            for response in exa_responses:
+                keys = (normalize_url(response.url), content_hash(response.summary))
+                if any(key in written or key in claimed for key in keys):
+                    continue
+                claimed.update(keys)
+                job["claimed"].append(keys)
+                new_responses.append(response)
+        return new_responses
+
+    def release_claims(job):
+        with claims_lock:
+            unwritten_urls = [url for url, digest in job.get("claimed", []) if url not in written]
+            for keys in job.pop("claimed", []):
+                claimed.difference_update(keys)
+        # Harvested but not written, so a later query may harvest them again
+        if USE_EXA_HARVESTER and unwritten_urls:
+            get_harvest_index().discard(unwritten_urls)
+
+    def optimize(job):
+        job["optimized_query"] = run_dspy_user_query_optimizer(user_prompt=job["query"])
+        return job
+
+    def summary_prompt(job):
+        job["summary_prompt"] = run_dspy_summarizer_prompt_optimizer(user_prompt=job["optimized_query"])
+        return job
+
+    def search(job):
+        if USE_EXA_HARVESTER:
+            exa_responses = harvest_exa_responses(search_query=job["optimized_query"], summary_prompt=job["summary_prompt"])
+        else:
+            exa_responses = get_exa_responses(search_query=job["optimized_query"], summary_prompt=job["summary_prompt"])
+        job["exa_responses"] = claim_new(job, exa_responses)
+        return job
+
+    def generate(job):
+        exa_responses = job.pop("exa_responses")
+        job["records"] = [
+            {"key": normalize_url(response.url), "user": likely_user_query, "assistant": response.summary}
+            for response, likely_user_query in zip(exa_responses, generate_likely_user_queries(exa_responses))
+            if likely_user_query is not None
+        ]
+        job["system_prompt"] = generate_system_prompt(job["records"][:3]) if job["records"] else None
+        return job
+
+    def on_result(query, job):
+        # Runs on the main thread, so the writer is only ever used from one thread
+        for record in job["records"]:
+            writer.write(user=record["user"], assistant=record["assistant"], key=record["key"], system=job["system_prompt"])
+            with claims_lock:
+                written.update((record["key"], content_hash(record["assistant"])))
+        # The harvested documents only go in the index once their examples are safely on disk
+        if USE_EXA_HARVESTER and job["records"]:
+            writer.sync()
+            get_harvest_index().commit([record["key"] for record in job["records"]])
+        release_claims(job)
+        print(f"✅ {len(job['records'])} new examples for: {query[:80]}")
+
+    def on_error(job, stage_name, error):
+        # The results this query had claimed weren't written, another query can still use them
+        release_claims(job)
+        print(f"❌ Error in {stage_name} stage for '{job['query'][:80]}': {str(error)}")
+
+    pipeline = Pipeline([
+        Stage("optimize", optimize, BATCH_OPTIMIZE_CONCURRENCY),
+        Stage("summary_prompt", summary_prompt, BATCH_SUMMARY_PROMPT_CONCURRENCY),
+        Stage("search", search, BATCH_SEARCH_CONCURRENCY),
+        Stage("generate", generate, BATCH_GENERATE_CONCURRENCY),
+    ], report_every=BATCH_REPORT_EVERY)
+
+    with writer:
+        pipeline.run([{"query": query} for query in queries], on_result=lambda job, result: on_result(job["query"], result),
+                     on_error=on_error)
+        if writer.count == 0:
+            print("No data found, please try again with more exa responses")
+            return
+        file_path = writer.finalize()
+    print(f"\n\n📝 \033[38;5;218m{writer.count} training examples saved to {file_path}\033[0m\n\n")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic training data from Exa search results")
+    parser.add_argument("--queries", help="File with one search query per line, runs them all as a batch")
+    parser.add_argument("--run-name", default=TRAINING_DATA_RUN_NAME, help="Fixed name for the output file, needed to resume")
+    parser.add_argument("--resume", action="store_true", default=RESUME_TRAINING_DATA, help="Resume the run with the same run name")
+    args = parser.parse_args()
     try:
         start_time = time.time()
         
-        # Run DSPy to optimize the user query
-        optimized_user_query = run_dspy_user_query_optimizer(user_prompt=SEARCH_QUERY)
-        
-        # Run DSPy to optimize the summary prompt
-        optimized_summary_prompt = run_dspy_summarizer_prompt_optimizer(user_prompt=optimized_user_query)
-        
-        # Run Exa to get the results
-        exa_responses = get_exa_responses(search_query=optimized_user_query, summary_prompt=optimized_summary_prompt)
-        
-        print("\n\n🔎 Exa responses:\n")
-        
-        # Generate training data
-        generate_training_data(exa_responses)
+        if args.queries:
+            # Run every query in the file through the pipeline, into one merged training data file
+            run_batch(args.queries, run_name=args.run_name, resume=args.resume)
+        else:
+            # Run DSPy to optimize the user query
+            optimized_user_query = run_dspy_user_query_optimizer(user_prompt=SEARCH_QUERY)
+            
+            # Run DSPy to optimize the summary prompt
+            optimized_summary_prompt = run_dspy_summarizer_prompt_optimizer(user_prompt=optimized_user_query)
+            
+            # Run Exa to get the results
+            if USE_EXA_HARVESTER:
+                exa_responses = harvest_exa_responses(search_query=optimized_user_query, summary_prompt=optimized_summary_prompt)
+            else:
+                exa_responses = get_exa_responses(search_query=optimized_user_query, summary_prompt=optimized_summary_prompt)
+            
+            print("\n\n🔎 Exa responses:\n")
+            
+            # Generate training data
+            generate_training_data(exa_responses, run_name=args.run_name, resume=args.resume)
         
         # Log the time taken
         end_time = time.time()
+        cache_stats = llm_cache.stats()
+        print(f"\n\n💾 LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)")
+        print(f"\n🧩 Structured output: {extraction_stats}")
         print(f"\n\n🏁 Total time taken: {end_time - start_time:.2f} seconds\n\n\n\n\n")
     except Exception as e:
         print(f"\n\n❌ Error: {str(e)}")
@@ -0,0 +1,84 @@
+import re
+
+# Max transcript characters per chunk, roughly 6k tokens or 25 minutes of talking
+MAX_CHUNK_CHARS = 24000
+# How often a [m:ss] marker is put in the chunk text, so the model can point at moments in the video
+TIMESTAMP_EVERY_SECONDS = 60
+# [12:34] or [1:02:03] timestamps in model output
+TIMESTAMP_PATTERN = re.compile(r"\[((?:\d+:)?\d{1,2}:\d{2})\](?!\()")
+
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def parse_timestamp(timestamp):
+    seconds = 0
+    for part in timestamp.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def timestamp_url(video_id, seconds):
+    return f"https://www.youtube.com/watch?v={video_id}&t={int(seconds)}s"
+
+
+def link_timestamps(markdown, video_id):
+    # Turns every [12:34] in the text into a link to that moment in the video
+    return TIMESTAMP_PATTERN.sub(
+        lambda match: f"[{match.group(1)}]({timestamp_url(video_id, parse_timestamp(match.group(1)))})",
+        markdown,
+    )
+
+
+def chunk_segments(segments, max_chars=MAX_CHUNK_CHARS):
+    # Groups TranscriptSegments into chunks of up to max_chars, only ever splitting between segments. Returns [{'start', 'end', 'text'}],
+    # with a [m:ss] marker in the text at the start of each chunk and about every minute after that.
+    chunks = []
+    texts = []
+    size = 0
+    start = end = last_marker = 0.0
+    for text, segment_start, duration in segments:
+        if texts and size + len(text) > max_chars:
+            chunks.append({'start': start, 'end': end, 'text': ' '.join(texts)})
+            texts = []
+            size = 0
+        if not texts:
+            start = segment_start
+        if not texts or segment_start - last_marker >= TIMESTAMP_EVERY_SECONDS:
+            last_marker = segment_start
+            texts.append(f"[{format_timestamp(last_marker)}]")
+            size += len(texts[-1]) + 1
+        texts.append(text)
+        size += len(text) + 1
+        end = segment_start + duration
+    if texts:
+        chunks.append({'start': start, 'end': end, 'text': ' '.join(texts)})
+    return chunks
+
+
+def chunk_text(text, max_chars=MAX_CHUNK_CHARS):
+    # For transcripts saved without segments, splits on whitespace. The chunks have no timestamps.
+    chunks = []
+    while text:
+        if len(text) <= max_chars:
+            split_at = len(text)
+        else:
+            split_at = text.rfind(' ', 0, max_chars + 1)
+            split_at = split_at if split_at > 0 else max_chars
+        chunks.append({'start': None, 'end': None, 'text': text[:split_at].strip()})
+        text = text[split_at:].strip()
+    return chunks
+
+
+def has_timestamps(chunks):
+    return bool(chunks) and chunks[0]['start'] is not None
+
+
+def chunk_transcript(video_data, max_chars=MAX_CHUNK_CHARS):
+    if video_data.get('segments') is not None and len(video_data['segments']):
+        return chunk_segments(video_data['segments'], max_chars)
+    return chunk_text(video_data.get('transcript', ''), max_chars)
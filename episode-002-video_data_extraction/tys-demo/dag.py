@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class DAG:
+    # A small task graph. Every task is submitted to the executor as soon as the tasks it depends on
+    # are done, so independent tasks run at the same time. Task functions are called with the results
+    # of their dependencies as keyword arguments, named after the dependencies.
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, fn, deps=()):
+        # Dependencies have to be added first, which also keeps the graph free of cycles
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+        self.tasks[name] = (fn, tuple(deps))
+        return self
+
+    def run(self, executor=None):
+        # Returns {task name: result}. Pass a shared executor to put a global cap on how many tasks
+        # (of this and any other graph) run at once. The first task error is raised.
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=max(1, len(self.tasks)))
+        results = {}
+        pending = dict(self.tasks)
+        running = {}
+        try:
+            while pending or running:
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        running[executor.submit(fn, **{dep: results[dep] for dep in deps})] = name
+                        del pending[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        except Exception:
+            for future in running:
+                future.cancel()
+            raise
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+        return results
@@ -1,13 +1,19 @@
 import os
-import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from googleapiclient.discovery import build
-from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
 from dotenv import load_dotenv
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 import pickle
 from datetime import datetime, timezone
+from rate_limit import TokenBucket
+from metadata_cache import MetadataCache
+from transcript_store import TranscriptStore
+from segments import TranscriptSegments
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,13 +21,28 @@ load_dotenv()
 API_KEY = os.environ.get('YOUTUBE_API_KEY')
 PLAYLIST_ID = os.environ.get('YOUTUBE_PLAYLIST_ID')
 
-base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SCOPES = ['https://www.googleapis.com/auth/youtube']
 
-unprocessed_dir = os.path.join(base_dir, "experiments", "youtube", "transcripts", "unprocessed")
+# Max number of playlist items ingested at once
+MAX_INGEST_WORKERS = 8
+# Per-endpoint rate limits (requests per second) shared by all ingest workers
+YOUTUBE_API_REQUESTS_PER_SECOND = 10
+TRANSCRIPT_REQUESTS_PER_SECOND = 2
+# Parts of each video resource we use
+VIDEO_PARTS = ("snippet", "contentDetails", "statistics")
+# Max ids per videos().list / channels().list request, the API doesn't accept more
+MAX_IDS_PER_REQUEST = 50
+# Video and channel metadata cache, see metadata_cache.py for the per-part TTLs
+METADATA_CACHE_PATH = os.path.expanduser("~/.cache/tool-use/youtube_metadata.sqlite")
+# Number of passes over the retry queue before an item is reported as failed
+MAX_INGEST_ATTEMPTS = 3
 
-SCOPES = ['https://www.googleapis.com/auth/youtube']
+youtube_api_limiter = TokenBucket(rate=YOUTUBE_API_REQUESTS_PER_SECOND)
+transcript_limiter = TokenBucket(rate=TRANSCRIPT_REQUESTS_PER_SECOND)
+metadata_cache = MetadataCache(METADATA_CACHE_PATH)
+transcript_store = TranscriptStore()
 
-def get_authenticated_service():
+def get_credentials():
     creds = None
     if os.path.exists('token.pickle'):
         with open('token.pickle', 'rb') as token:
@@ -38,59 +59,115 @@ def get_authenticated_service():
         with open('token.pickle', 'wb') as token:
             pickle.dump(creds, token)
     
-    return build('youtube', 'v3', credentials=creds)
+    return creds
+
+credentials = get_credentials()
+_thread_local = threading.local()
 
-youtube = get_authenticated_service()
+def get_youtube():
+    # The API client isn't thread-safe, so every worker thread builds its own from the shared credentials
+    if not hasattr(_thread_local, 'youtube'):
+        _thread_local.youtube = build('youtube', 'v3', credentials=credentials, cache_discovery=False)
+    return _thread_local.youtube
 
 def get_playlist_items(playlist_id):
-    request = youtube.playlistItems().list(
+    request = get_youtube().playlistItems().list(
         part="snippet,contentDetails",
         playlistId=playlist_id,
         maxResults=50
     )
-    response = request.execute()
     playlist_items = []
     while request is not None:
+        youtube_api_limiter.acquire()
         response = request.execute()
         playlist_items.extend(response["items"])
-        request = youtube.playlistItems().list_next(request, response)
+        request = get_youtube().playlistItems().list_next(request, response)
     return playlist_items
 
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def get_videos_details(video_ids):
+    # Returns {video_id: video resource}. Fresh parts come from the metadata cache, the stale ones are
+    # fetched 50 videos per request, grouped by which parts they're missing (usually just statistics).
+    details = {}
+    stale = {}
+    for video_id in dict.fromkeys(video_ids):
+        details[video_id] = {'id': video_id, **metadata_cache.get_video(video_id)}
+        missing_parts = tuple(part for part in VIDEO_PARTS if part not in details[video_id])
+        if missing_parts:
+            stale.setdefault(missing_parts, []).append(video_id)
+
+    for missing_parts, ids in stale.items():
+        for chunk in chunked(ids, MAX_IDS_PER_REQUEST):
+            request = get_youtube().videos().list(
+                part=','.join(missing_parts),
+                id=','.join(chunk)
+            )
+            youtube_api_limiter.acquire()
+            response = request.execute()
+            for item in response.get('items', []):
+                metadata_cache.put_video(item, missing_parts)
+                details[item['id']].update({part: item.get(part, {}) for part in missing_parts})
+    # Videos the API didn't return (private or deleted) are left out
+    return {video_id: item for video_id, item in details.items() if all(part in item for part in VIDEO_PARTS)}
+
 def get_video_details(video_id):
-    request = youtube.videos().list(
-        part="snippet,contentDetails,statistics",
-        id=video_id
-    )
-    response = request.execute()
-    return response['items'][0]
+    details = get_videos_details([video_id])
+    if video_id not in details:
+        raise ValueError(f"No details found for video {video_id}, it may be private or deleted")
+    return details[video_id]
 
-def get_transcript(video_id):
+def get_transcript_segments(video_id):
+    # Returns the timed transcript as TranscriptSegments, or None if the video has no transcript.
+    # Other errors (network, throttling) are raised so they can be retried.
     try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)
-        return ' '.join([entry['text'] for entry in transcript])
-    except Exception as e:
-        print(f"\nError fetching transcript for video {video_id}: {str(e)}")
+        transcript_limiter.acquire()
+        return TranscriptSegments.from_entries(YouTubeTranscriptApi.get_transcript(video_id))
+    except (TranscriptsDisabled, NoTranscriptFound) as e:
+        print(f"\nNo transcript available for video {video_id}: {str(e)}")
         return None
 
+def get_transcript(video_id):
+    segments = get_transcript_segments(video_id)
+    return segments.text if segments else None
+
 def remove_from_playlist(playlist_item_id):
-    try:
-        youtube.playlistItems().delete(id=playlist_item_id).execute()
-        print(f"\n❌Removed video {playlist_item_id} from playlist\n\n")
-    except Exception as e:
-        print(f"\nError removing video {playlist_item_id} from playlist: {str(e)}\n")
+    youtube_api_limiter.acquire()
+    get_youtube().playlistItems().delete(id=playlist_item_id).execute()
+    print(f"\n❌Removed video {playlist_item_id} from playlist\n\n")
         
+def get_channel_names(channel_ids):
+    # Returns {channel_id: channel title}, from the metadata cache or 50 channels per request
+    names = {}
+    missing = []
+    for channel_id in dict.fromkeys(channel_ids):
+        title = metadata_cache.get_channel_title(channel_id)
+        if title is None:
+            missing.append(channel_id)
+        else:
+            names[channel_id] = title
+
+    for chunk in chunked(missing, MAX_IDS_PER_REQUEST):
+        request = get_youtube().channels().list(
+            part="snippet",
+            id=','.join(chunk)
+        )
+        youtube_api_limiter.acquire()
+        response = request.execute()
+        for item in response.get('items', []):
+            names[item['id']] = item['snippet']['title']
+            metadata_cache.put_channel_title(item['id'], names[item['id']])
+    return names
+
 def get_channel_name(channel_id):
-    request = youtube.channels().list(
-        part="snippet",
-        id=channel_id
-    )
-    response = request.execute()
-    return response['items'][0]['snippet']['title']
+    return get_channel_names([channel_id])[channel_id]
 
 
 def get_latest_video_from_channel(channel_id):
     try:
-        request = youtube.search().list(
+        request = get_youtube().search().list(
             part="id,snippet",
             channelId=channel_id,
             order="date",
@@ -112,7 +189,7 @@ def get_latest_video_from_channel(channel_id):
 
 def add_video_to_playlist(video_id, playlist_id):
     try:
-        youtube.playlistItems().insert(
+        get_youtube().playlistItems().insert(
             part="snippet",
             body={
                 "snippet": {
@@ -136,66 +213,117 @@ def get_transcript_from_latest_video(channel_id):
         print("Failed to add latest video to playlist")
 
 
-def generate_transcripts():
+def generate_transcripts(max_workers=MAX_INGEST_WORKERS):
     try:
         playlist_items = get_playlist_items(PLAYLIST_ID)
         print(f"\nFound {len(playlist_items)} videos in playlist: {PLAYLIST_ID}\n")
-        for item in playlist_items:
-            handle_playlist_item(item)
+        # Look up video and channel metadata for the whole playlist up front, 50 ids per request
+        video_details = get_videos_details([get_video_id(playlist_item) for playlist_item in playlist_items])
+        channel_ids = [details['snippet']['channelId'] for details in video_details.values() if details.get('snippet', {}).get('channelId')]
+        channel_names = get_channel_names(channel_ids)
+        failed = ingest_playlist_items(playlist_items, max_workers=max_workers, video_details=video_details, channel_names=channel_names)
             
-        print(f"\n\n🏁 All done making transcript json files!\n")
+        if failed:
+            print(f"\n\n⚠️  {len(failed)} videos failed after {MAX_INGEST_ATTEMPTS} attempts:")
+            for playlist_item, error in failed:
+                print(f"  - {get_video_id(playlist_item)}: {str(error)}")
+        print(f"\n💾 Metadata cache: {metadata_cache}")
+        print(f"\n\n🏁 All done saving transcripts!\n")
+        return failed
     except Exception as e:
         print(f"Error in generate_transcripts: {str(e)}")
 
 
-def handle_playlist_item(playlist_item, remove=True):
+def ingest_playlist_items(playlist_items, max_workers=MAX_INGEST_WORKERS, remove=True, video_details=None, channel_names=None):
+    # Ingest the items on a worker pool. Failed items go to a retry queue that's worked through again
+    # (with a growing pause between passes), whatever still fails is returned as (playlist_item, error) pairs.
+    retry_queue = [(playlist_item, None) for playlist_item in playlist_items]
+    for attempt in range(1, MAX_INGEST_ATTEMPTS + 1):
+        if attempt > 1:
+            print(f"\n🔁 Retrying {len(retry_queue)} failed videos (attempt {attempt}/{MAX_INGEST_ATTEMPTS})\n")
+            time.sleep(2 ** attempt)
+        pending = [playlist_item for playlist_item, _ in retry_queue]
+        retry_queue = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(ingest_playlist_item, playlist_item, remove, video_details, channel_names): playlist_item
+                for playlist_item in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error processing video {get_video_id(futures[future])}: {str(e)}")
+                    retry_queue.append((futures[future], e))
+        if not retry_queue:
+            break
+    return retry_queue
+
+
+def get_video_id(playlist_item):
     try:
-        video_id = playlist_item['contentDetails']['videoId']
+        return playlist_item['contentDetails']['videoId']
     except Exception as e:
         print(f"playlist_item is missing contentDetails, using playlist_item['id'] instead: {str(e)}")
-        video_id = playlist_item['id']['videoId']
-        
+        return playlist_item['id']['videoId']
+
+
+def handle_playlist_item(playlist_item, remove=True):
     try:
-        video_details = get_video_details(video_id)
-        transcript = get_transcript(video_id)
-        if transcript:
-            channel_id = video_details.get('snippet', {}).get('channelId', '')
-            channel_name = get_channel_name(channel_id) if channel_id else ''
-            title = video_details.get('snippet', {}).get('title', '')
-            print(f"\n\n🎥 Processing:\n {title}\n\nChannel: {channel_name}")   
-            data = {
-                'title': title,
-                "channel_name": channel_name,
-                'publish_date': video_details['snippet'].get('publishedAt', ''),
-                'processed_date': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
-                'view_count': video_details['statistics'].get('viewCount', '0'),
-                'like_count': video_details['statistics'].get('likeCount', '0'),
-                'comment_count': video_details['statistics'].get('commentCount', '0'),
-                'duration': video_details['contentDetails'].get('duration', ''),
-                'video_id': video_id,
-                'description': video_details['snippet'].get('description', ''),
-                "channel_id": channel_id,
-                'thumbnail': video_details['snippet'].get('thumbnails', {}).get('high', {}).get('url', ''),
-                'transcript': transcript,
-                'video_url': f"https://www.youtube.com/watch?v={video_id}"
-            }
-            with open(f"{unprocessed_dir}/{video_id}.json", 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            
-            print(f"\n✅Saved transcript and details for video {video_id}")
-            
-            if remove:
-                remove_from_playlist(playlist_item['id'])
-        else:
-            print(f"\nSkipping video {video_id} due to missing transcript\n")
+        ingest_playlist_item(playlist_item, remove=remove)
     except Exception as e:
-        print(f"Error processing video {video_id}: {str(e)}")
+        print(f"Error processing video {get_video_id(playlist_item)}: {str(e)}")
+
+
+def ingest_playlist_item(playlist_item, remove=True, video_details=None, channel_names=None):
+    # Fetches and saves one video, errors are raised to the caller. Prefetched metadata is used when
+    # available, anything missing from it is looked up on its own.
+    video_id = get_video_id(playlist_item)
+    video_details = video_details or {}
+    channel_names = channel_names or {}
+        
+    video_details = video_details[video_id] if video_id in video_details else get_video_details(video_id)
+    segments = get_transcript_segments(video_id)
+    transcript = segments.text if segments else None
+    if transcript:
+        channel_id = video_details.get('snippet', {}).get('channelId', '')
+        if channel_id in channel_names:
+            channel_name = channel_names[channel_id]
+        else:
+            channel_name = get_channel_name(channel_id) if channel_id else ''
+        title = video_details.get('snippet', {}).get('title', '')
+        print(f"\n\n🎥 Processing:\n {title}\n\nChannel: {channel_name}")   
+        data = {
+            'title': title,
+            "channel_name": channel_name,
+            'publish_date': video_details['snippet'].get('publishedAt', ''),
+            'processed_date': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'view_count': video_details['statistics'].get('viewCount', '0'),
+            'like_count': video_details['statistics'].get('likeCount', '0'),
+            'comment_count': video_details['statistics'].get('commentCount', '0'),
+            'duration': video_details['contentDetails'].get('duration', ''),
+            'video_id': video_id,
+            'description': video_details['snippet'].get('description', ''),
+            "channel_id": channel_id,
+            'thumbnail': video_details['snippet'].get('thumbnails', {}).get('high', {}).get('url', ''),
+            'transcript': transcript,
+            'segments': segments,
+            'video_url': f"https://www.youtube.com/watch?v={video_id}"
+        }
+        transcript_store.upsert(data)
+        
+        print(f"\n✅Saved transcript and details for video {video_id}")
+        
+        if remove:
+            remove_from_playlist(playlist_item['id'])
+    else:
+        print(f"\nSkipping video {video_id} due to missing transcript\n")
         
 
 def add_videos_to_playlist(video_ids):
     for video_id in video_ids:
         try:
-            request = youtube.playlistItems().insert(
+            request = get_youtube().playlistItems().insert(
                 part="snippet",
                 body={
                     "snippet": {
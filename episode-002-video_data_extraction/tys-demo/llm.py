@@ -1,11 +1,17 @@
 import os
+import threading
 import google.generativeai as genai
 
 genai.configure(api_key=os.environ["GOOGLE_GEMINI_API_KEY"])
 
+MODEL_NAME = "gemini-1.5-flash"
 
-def gemini_response(prompt, temp=0):
-    # Create the model
+# One model object per generation config, shared by every call and thread
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_model(temp=0):
     generation_config = {
     "temperature": temp,
     "top_p": 0.95,
@@ -13,16 +19,21 @@ def gemini_response(prompt, temp=0):
     "max_output_tokens": 10192,
     "response_mime_type": "text/plain",
     }
+    key = tuple(sorted(generation_config.items()))
+    if key not in _models:
+        with _models_lock:
+            if key not in _models:
+                # Create the model
+                _models[key] = genai.GenerativeModel(
+                model_name=MODEL_NAME,
+                generation_config=generation_config,
+                )
+    return _models[key]
 
-    model = genai.GenerativeModel(
-    model_name="gemini-1.5-flash",
-    generation_config=generation_config,
-    )
 
-    chat_session = model.start_chat(
-    history=[]
-    )
+def gemini_response(prompt, temp=0):
+    # A single generate_content call, no chat session needed for one message
+    response = get_model(temp).generate_content(prompt)
 
-    response = chat_session.send_message(prompt)
+    return response.text
 
-    return response.text
\ No newline at end of file
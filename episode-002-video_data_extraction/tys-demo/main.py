@@ -1,9 +1,7 @@
 import argparse
 import os
-from generate_transcripts import generate_transcripts   
-from add_videos import add_videos
-from process_transcript import process_all_transcripts
-from roast import roast_channel
+# The other modules are imported in main(), not here: they sign in to Google and set up the API clients
+# when imported, and with the spawn start method every rebuild_vault worker process imports this file again.
 
 NUMBER_OF_VIDEOS_TO_ADD=5
 TEXT_TO_INCLUDE=None
@@ -17,14 +15,24 @@ def main():
     parser.add_argument("--include", nargs='+', default=TEXT_TO_INCLUDE, help="Include videos with these words in the title")
     parser.add_argument("--exclude", nargs='+', default=TEXT_TO_EXCLUDE, help="Exclude videos with these words in the title")
     parser.add_argument("--num", type=int, default=NUMBER_OF_VIDEOS_TO_ADD, help="Number of videos to add (default: 5)")
+    parser.add_argument("--rebuild-vault", action="store_true", help="Re-render every note from the transcript store, without calling the LLM")
+    parser.add_argument("--reprocess", action="store_true", help="Also redo processed videos whose transcript, prompts or model changed")
 
     
     args = parser.parse_args()
-    if args.roast:
+    if args.rebuild_vault:
+        from render import rebuild_vault
+        rebuild_vault()
+        return
+    elif args.roast:
+        from roast import roast_channel
         print("Roast mode enabled!\n")
         roast_channel(ROAST_CHANNEL_ID)
         return
-    elif args.discover:
+    from generate_transcripts import generate_transcripts
+    from process_transcript import process_all_transcripts
+    if args.discover:
+        from add_videos import add_videos
         query = ' '.join(args.discover)
         print(f"Discovering videos for: {query}")
         print(f"Number of videos to add: {args.num}")
@@ -37,7 +45,7 @@ def main():
     # Generate transcripts for the videos in the playlist
     generate_transcripts()
     
-    process_all_transcripts()
+    process_all_transcripts(reprocess=args.reprocess)
         
     print("\n\n🏁 Done!\n\n")
     
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Where the cache lives on disk
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.cache/tool-use/youtube_metadata.sqlite")
+# How long each part of a video resource stays fresh, in seconds. Titles and durations hardly ever
+# change, view/like/comment counts go stale quickly.
+VIDEO_PART_TTLS = {
+    "snippet": 7 * 24 * 3600,
+    "contentDetails": 30 * 24 * 3600,
+    "statistics": 3600,
+}
+# Channel names almost never change
+CHANNEL_TITLE_TTL = 30 * 24 * 3600
+
+
+class MetadataCache:
+    # Persistent cache of YouTube video parts and channel titles, each with its own TTL. Lookups
+    # only return fresh entries, so the caller knows exactly which parts still need an API request.
+    def __init__(self, path=DEFAULT_CACHE_PATH, part_ttls=None, channel_ttl=CHANNEL_TITLE_TTL):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.part_ttls = part_ttls or VIDEO_PART_TTLS
+        self.channel_ttl = channel_ttl
+        self.hits = {}
+        self.misses = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS video_parts (
+                video_id TEXT NOT NULL,
+                part TEXT NOT NULL,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (video_id, part)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS channels (
+                channel_id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _record(self, kind, hit):
+        counts = self.hits if hit else self.misses
+        counts[kind] = counts.get(kind, 0) + 1
+
+    def get_video(self, video_id, parts=None):
+        # Returns {part: data} for the parts that are still fresh, stale or missing parts are left out
+        parts = parts or list(self.part_ttls)
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT part, data, fetched_at FROM video_parts WHERE video_id = ?", (video_id,)
+            ).fetchall()
+            cached = {
+                part: json.loads(data) for part, data, fetched_at in rows
+                if part in parts and now - fetched_at < self.part_ttls.get(part, 0)
+            }
+            for part in parts:
+                self._record(part, part in cached)
+        return cached
+
+    def put_video(self, item, parts=None):
+        # Stores the given parts of a videos().list item
+        parts = parts or [part for part in self.part_ttls if part in item]
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO video_parts (video_id, part, data, fetched_at) VALUES (?, ?, ?, ?)",
+                [(item["id"], part, json.dumps(item.get(part, {})), now) for part in parts],
+            )
+            self._conn.commit()
+
+    def get_channel_title(self, channel_id):
+        # Returns None if the title isn't cached or has expired
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, fetched_at FROM channels WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+            title = row[0] if row and time.time() - row[1] < self.channel_ttl else None
+            self._record("channel", title is not None)
+        return title
+
+    def put_channel_title(self, channel_id, title):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO channels (channel_id, title, fetched_at) VALUES (?, ?, ?)",
+                (channel_id, title, time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            kinds = sorted(set(self.hits) | set(self.misses))
+            stats = {kind: {"hits": self.hits.get(kind, 0), "misses": self.misses.get(kind, 0)} for kind in kinds}
+        hits = sum(s["hits"] for s in stats.values())
+        total = hits + sum(s["misses"] for s in stats.values())
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    def __str__(self):
+        stats = self.stats()
+        hit_rate = stats.pop("hit_rate")
+        parts = ", ".join(f"{kind} {s['hits']}/{s['hits'] + s['misses']}" for kind, s in stats.items())
+        return f"{hit_rate:.0%} hit rate ({parts})"
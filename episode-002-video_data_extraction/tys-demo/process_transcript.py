@@ -1,34 +1,53 @@
 import os
-import dspy
 import json
-import shutil
-from datetime import datetime
+import dspy
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dsp.modules import GoogleVertexAI  
 from google.oauth2 import service_account
 os.environ['GRPC_VERBOSITY'] = 'error'
-from llm import gemini_response
+from llm import gemini_response, MODEL_NAME
+from transcript_store import TranscriptStore
+from dag import DAG
+from chunking import chunk_transcript, format_timestamp, has_timestamps
+from render import write_markdown, output_dir
 
 # llm = dspy.OllamaLocal(model="llama3.1")
 # dspy.configure(lm=llm)
 
-base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-output_env = os.getenv("OUTPUT_DIR")
-output_dir = os.path.expanduser(output_env)
+# Max number of videos processed at once
+MAX_VIDEO_WORKERS = 4
+# Max number of Gemini calls in flight across all videos
+MAX_CONCURRENT_LLM_CALLS = 8
+# Model DSPy uses to write the summarization prompt
+DSPY_MODEL_NAME = "gemini-1.5-flash-001"
+# Bump a prompt's version after changing it. Saved outputs of that stage (and every stage after it) are
+# then regenerated on the next run, everything else is reused.
+PROMPT_VERSIONS = {
+    "summarization_prompt": 1,
+    "chunk_notes": 1,
+    "summary": 1,
+    "key_takeaways": 1,
+    "one_key_takeaway": 1,
+    "tldr": 1,
+    "constructive": 1,
+    "roast": 1,
+}
 
-unprocessed_dir = os.path.join(base_dir, "experiments", "youtube", "transcripts", "unprocessed")
-
-processed_dir = os.path.join(base_dir,  "experiments", "youtube","transcripts", "processed")
+transcript_store = TranscriptStore()
         
 
-def process_all_transcripts(roast=False):
+def process_all_transcripts(roast=False, max_workers=MAX_VIDEO_WORKERS, reprocess=False):
+    # Processes new videos, and retries failed ones (finished stages are reused). With reprocess, processed
+    # videos are checked too, and the ones whose transcript, prompts or model changed are redone.
     try:
         print("\n\n📝 Processing transcripts...\n")
         # configure and authenticate the vertex ai model for DSPy
+        # (on this thread, the worker threads use the settings configured here)
         credentials_path = os.path.join(os.getcwd(), "service_account_secret.json")
         credentials = service_account.Credentials.from_service_account_file(credentials_path)
         vertex_ai = GoogleVertexAI(
-            model_name="gemini-1.5-flash-001",
+            model_name=DSPY_MODEL_NAME,
             project="booming-octane-433204-v6",
             location="us-central1",
             credentials=credentials
@@ -38,65 +57,169 @@ def process_all_transcripts(roast=False):
         
         
 
-        os.makedirs(processed_dir, exist_ok=True)
         os.makedirs(output_dir, exist_ok=True)
         
-        for filename in os.listdir(unprocessed_dir):
-            print(f"📄 Processing {filename}")
-            if filename.endswith(".json"):
-                file_path = os.path.join(unprocessed_dir, filename)
-                
-                with open(file_path, 'r') as file:
-                    video_data = json.load(file)
-                
-                if roast:
-                    markdown_content = roast_transcript(video_data)
-
-                else:
-                    summary = process_transcript(
-                        video_data['transcript'],
-                        video_data['title'],
-                        video_data['description']
-                    )
-
-                    markdown_content = create_markdown_with_frontmatter(summary, video_data)
-                    
-
-                # Create markdown filename
-                md_filename = video_data['title'][:100]  # Limit length to first 100 characters
-                md_filename = ''.join(c if c.isalnum() or c in [' ', '-', '_'] else '_' for c in md_filename)
-                md_filename = md_filename.strip() + ".md"
-                md_file_path = os.path.join(output_dir, md_filename)
-                
-                print(f"\n📝 Writing md to {md_file_path}")
-                with open(md_file_path, 'w') as md_file:
-                    md_file.write(markdown_content)
-                    
-                    
-                # Move processed JSON file
-                shutil.move(file_path, os.path.join(processed_dir, filename))
-
-                print(f"✅Processed: {filename}\n")
+        states = ["unprocessed", "failed"] + (["processed"] if reprocess else [])
+        video_ids = [video_id for state in states for video_id in transcript_store.ids_by_state(state)]
+        # Videos are processed on one pool, and every LLM call of every video goes through a second, shared
+        # pool. The LLM pool is the global concurrency budget, video workers only wait on it.
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_LLM_CALLS, thread_name_prefix="llm") as llm_executor, \
+                ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="video") as video_executor:
+            list(video_executor.map(lambda video_id: process_video(video_id, roast, llm_executor), video_ids))
+    except Exception as e:
+        print(f"🚨 Error processing transcripts: {e}")
+
+
+def hash_inputs(*inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cached_stage(video_id, stage, inputs, fn, prompt=None):
+    # Runs fn() unless this stage was already done for this video with the same inputs, prompt version and
+    # model, in which case the saved output is returned. Outputs feed later stages' inputs, so a change
+    # anywhere also redoes everything that depends on it.
+    prompt = prompt or stage
+    input_hash = hash_inputs(stage, PROMPT_VERSIONS[prompt], MODEL_NAME, DSPY_MODEL_NAME, inputs)
+    output = transcript_store.get_stage_output(video_id, stage, input_hash)
+    if output is not None:
+        print(f"\n♻️  Reusing saved {stage} for {video_id}")
+        return output
+    output = fn()
+    transcript_store.put_stage_output(video_id, stage, input_hash, output)
+    return output
+
+
+def process_video(video_id, roast=False, llm_executor=None):
+    video_data = transcript_store.get(video_id)
+    # Fingerprint of everything the markdown is made from, to tell whether a processed video is up to date
+    mode = "roast" if roast else "summary"
+    video_hash = hash_inputs(mode, PROMPT_VERSIONS, MODEL_NAME, DSPY_MODEL_NAME,
+                             video_data['title'], video_data['description'], video_data['transcript'])
+    if video_data['state'] == "processed" and transcript_store.get_stage_output(video_id, f"{mode}_markdown", video_hash):
+        print(f"⏭️  {video_id} is up to date")
+        return
+    print(f"📄 Processing {video_id}")
+    try:
+        if roast:
+            outputs = roast_transcript(video_data, llm_executor)
+
+        else:
+            outputs = process_transcript(video_data, llm_executor)
+
+        md_file_path = write_markdown(video_data, mode, outputs, transcript_store)
+        print(f"\n📝 Wrote md to {md_file_path}")
+            
+        transcript_store.put_stage_output(video_id, f"{mode}_markdown", video_hash, md_file_path)
+        transcript_store.set_state(video_id, "processed")
+
+        print(f"✅Processed: {video_id}\n")
     except Exception as e:
-        print(f"🚨 Error processing files: {e}")
+        # Marked as failed so one bad video doesn't stop the rest, it's retried on the next run
+        transcript_store.set_state(video_id, "failed", error=str(e))
+        print(f"🚨 Error processing {video_id}: {e}")
             
-def process_transcript(transcript, title, description):
+
+def process_transcript(video_data, llm_executor=None):
+    video_id = video_data['video_id']
+    title = video_data['title']
+    description = video_data['description']
     print(f"\nProcessing transcript for {title}\n")
+    chunks = chunk_transcript(video_data)
+    # The takeaways and the TLDR only need the summary, so they're generated at the same time.
+    # Long transcripts are summarized in chunks first (in parallel), and the summary is written from those notes.
+    # Every stage's output is saved, so a crashed or re-run video only redoes the stages that are missing or changed.
+    dag = DAG()
+    dag.add("summarization_prompt", lambda: cached_stage(
+        video_id, "summarization_prompt", [title, description],
+        lambda: generate_summarization_prompt(title, description)))
+    if len(chunks) > 1:
+        add_transcript_notes(dag, video_id, chunks, title)
+        dag.add("summary", lambda summarization_prompt, transcript_notes: cached_stage(
+            video_id, "summary", [summarization_prompt, transcript_notes],
+            lambda: generate_summary(summarization_prompt, chunks, transcript_notes)), deps=["summarization_prompt", "transcript_notes"])
+    else:
+        dag.add("summary", lambda summarization_prompt: cached_stage(
+            video_id, "summary", [summarization_prompt, chunks],
+            lambda: generate_summary(summarization_prompt, chunks)), deps=["summarization_prompt"])
+    dag.add("key_takeaways", lambda summary: cached_stage(
+        video_id, "key_takeaways", [summary], lambda: generate_key_takeaways(summary)), deps=["summary"])
+    dag.add("tldr", lambda summary: cached_stage(
+        video_id, "tldr", [summary], lambda: generate_tldr(summary)), deps=["summary"])
+    dag.add("one_key_takeaway", lambda key_takeaways: cached_stage(
+        video_id, "one_key_takeaway", [key_takeaways], lambda: generate_one_key_takeaway(key_takeaways)), deps=["key_takeaways"])
+    # Returns the outputs of every stage, render.py turns them into markdown
+    return dag.run(llm_executor)
+
+
+def generate_summarization_prompt(title, description):
     summarizer = YouTubeSummarizer()
     
     result = summarizer(title=title, description=description)
     print(f"🤖 Generated summary prompt: {result.summarization_prompt}")
+    return result.summarization_prompt
+
+
+def summarize_chunk(chunk, index, count, title):
+    # Map step: detailed notes on one part of a long transcript
+    position = f" It starts at [{format_timestamp(chunk['start'])}] in the video." if chunk['start'] is not None else ""
+    notes = gemini_response(f"""Here is part {index + 1} of {count} of the transcript of the video "{title}".{position} Write detailed notes on this part in markdown bullet points: the main points, arguments, stories, examples, and any numbers or names mentioned. Start each bullet with the [m:ss] timestamp from the transcript closest to what it's about.
     
+    Transcript:
+    {chunk['text']}""", temp=0.3)
+    print(f"\nNotes on part {index + 1}/{count}: {notes[:50]}...")
+    return notes
+
+
+def add_transcript_notes(dag, video_id, chunks, title):
+    # Adds one task per chunk, and a "transcript_notes" task that joins their notes in transcript order
+    chunk_names = []
+    for index, chunk in enumerate(chunks):
+        chunk_names.append(f"chunk_{index}")
+        dag.add(chunk_names[-1], lambda chunk=chunk, index=index: cached_stage(
+            video_id, f"chunk_{index}", [chunk, index, len(chunks), title],
+            lambda: summarize_chunk(chunk, index, len(chunks), title), prompt="chunk_notes"))
+
+    def join_notes(**notes):
+        return '\n\n'.join(
+            f"Part {index + 1}" + (f" [{format_timestamp(chunk['start'])}]" if chunk['start'] is not None else "") + f":\n{notes[name]}"
+            for index, (name, chunk) in enumerate(zip(chunk_names, chunks))
+        )
+    dag.add("transcript_notes", join_notes, deps=chunk_names)
+
+
+def generate_summary(summarization_prompt, chunks, transcript_notes=None):
+    # Reduce step: the summary is written from the whole transcript, or from the notes on each part if it's long
+    timestamps = " Refer to specific moments in the video with their [m:ss] timestamps." if has_timestamps(chunks) else ""
+    if transcript_notes:
+        prompt = f"""{summarization_prompt}
+
+    The transcript is too long to include in full, so here are notes on each part of it, in order.{timestamps}
+
+    Notes:
+    {transcript_notes}"""
+    else:
+        prompt = f"""{summarization_prompt}
+    {timestamps}
+
+    Transcript:
+    {chunks[0]['text'] if chunks else ''}"""
     # Generate a summary from the summarization prompt
-    summary = gemini_response(result.summarization_prompt, temp=0.5)
+    summary = gemini_response(prompt, temp=0.5)
     print(f"\nSummary: {summary[:50]}...")
+    return summary
+
+
+def generate_key_takeaways(summary):
     # Use the summary to extract the key takeaways
     key_takeaways = gemini_response(f""",Given a summary of a video transcript, extract the key takeaways in markdown bullet point format. The key takeaways are the most important points that someone should care about. They should ideally be actionable, interesting, or useful. Aim for 3-12 key takeaways.
                                     
     Summary:                        
     {summary}""", temp=0.5)
     print(f"\nKey takeaways: {key_takeaways[:50]}...")
-    
+    return key_takeaways
+
+
+def generate_one_key_takeaway(key_takeaways):
     # Use the key takeaways to select the most important one
     one_key_takeaway = gemini_response(f"""Of the following key takeaways of a video transcript, select the most actionable, interesting, or useful one. The one takeaway that someone really should care about. You can repeat it exactly, or rephrase it in a way that makes it more actionable and interesting.
     
@@ -104,54 +227,18 @@ def process_transcript(transcript, title, description):
     {key_takeaways}""", temp=1)
     
     print(f"\nOne key takeaway: {one_key_takeaway[:50]}...")
-    
-    # Use the summary and key takeaways to create a TLDR
+    return one_key_takeaway
+
+
+def generate_tldr(summary):
+    # Use the summary to create a TLDR
     tldr = gemini_response(f"""What's the TLDR from the following summary of video transcript? Why should someone care about it? What, in one to two sentences, is this summary in a nutshell? 
     
     Summary:                           
     {summary}""", temp=0.5)
     
     print(f"\nTLDR: {tldr[:50]}...")
-    
-    
-    md_data = f"""
-{"## TLDR" if not tldr.lower().startswith("tldr") else ""}
-{tldr}
-
-## Most useful takeaway
-**{one_key_takeaway}**
-
-## All key takeaways
-{key_takeaways}
-
-## Summary
-{summary}
-        
-## Transcript
-{transcript}
-    """
-    
-    return md_data
-
-
-def create_markdown_with_frontmatter(summary, video_data):
-    frontmatter = f"""---
-title: "{video_data['title']}"
-channel_name: "{video_data['channel_name']}"
-view_count: "{video_data['view_count']}"
-publish_date: "{video_data['publish_date']}"
-processed_date: "{datetime.now().isoformat()}"
-description: "{video_data['description']}"
----
-
-## {video_data['channel_name']}
-Published: {datetime.fromisoformat(video_data['publish_date']).strftime('%B %d, %Y')}, Processed: {datetime.now().strftime('%B %d, %Y')}
-
-[![Thumbnail]({video_data['thumbnail']})]({video_data['video_url']})
-
-{summary}
-"""
-    return frontmatter
+    return tldr
 
 
 class SummarizationPromptGenerator(dspy.Signature):
@@ -177,23 +264,16 @@ class YouTubeSummarizer(dspy.Module):
     
     
 
-def roast_transcript(video_data):
-    
-    useful_video_data = f"""
-    Video views: {video_data["view_count"]}
-    Likes: {video_data["like_count"]}
-    Comments: {video_data["comment_count"]}
-    Duration: {video_data["duration"]}
-    Transcript:
-    {video_data["transcript"]} """
-    
+def generate_constructive_feedback(video_data, useful_video_data):
     constructive = gemini_response(f"""You are a professional YouTuber and esteemed podcast host. Two aspiring podcasters have given you a podcast transcript from their latest episode: {video_data["title"]}, you have been tasked with giving constructive feedback. They are seeking actionable advice on how to improve the podcast. From growth tips like YouTube SEO, to delivery and content, nothing is off the table. What went well, what could improve, they want any and all feedback to improve their skills and final product. Format all responses as markdown, and remember to to be constructive and positive!
 
     {useful_video_data}
    """, temp=0.5)
     print(f"\nConstructive feedback: {constructive[:50]}...")
+    return constructive
 
 
+def generate_roast(video_data, useful_video_data):
     # ROAST 'EM!!!
     roast = gemini_response(f"""You're a witty comedian at a roast battle. Two aspiring podcasters have given you a podcast transcript from their latest episode: {video_data["title"]}, your job is to roast them. Comedy central style. Don't be afraid to give 'em a good ROAST!
     
@@ -207,24 +287,33 @@ def roast_transcript(video_data):
     Use this info to fuel your roast:
     {useful_video_data}""", temp=1)
     print(f"\nRoast: {roast[:50]}...")
+    return roast
+
+
+def roast_transcript(video_data, llm_executor=None):
+    chunks = chunk_transcript(video_data)
     
+    # Long transcripts are summarized in chunks first, and the feedback and roast work from those notes
+    dag = DAG()
+    if len(chunks) > 1:
+        add_transcript_notes(dag, video_data["video_id"], chunks, video_data["title"])
+    else:
+        dag.add("transcript_notes", lambda: chunks[0]['text'] if chunks else '')
     
+    def useful_video_data(transcript_notes):
+        return f"""
+    Video views: {video_data["view_count"]}
+    Likes: {video_data["like_count"]}
+    Comments: {video_data["comment_count"]}
+    Duration: {video_data["duration"]}
+    {"Transcript notes" if len(chunks) > 1 else "Transcript"}:
+    {transcript_notes} """
     
-    
-    md_data = f"""
-## {video_data['channel_name']}
-### Views: {video_data["view_count"]}
-### Likes: {video_data["like_count"]}
-### Comments: {video_data["comment_count"]}
-### Duration: {video_data["duration"]}
-Published: {datetime.fromisoformat(video_data['publish_date']).strftime('%B %d, %Y')}, Processed: {datetime.now().strftime('%B %d, %Y')}
-
-[![Thumbnail]({video_data['thumbnail']})]({video_data['video_url']})
-        
-## Constructive Feedback
-{constructive}
-        
-## ROAST 🔥
-{roast}
-    """
-    return md_data
\ No newline at end of file
+    # The feedback and the roast don't depend on each other, so they're generated at the same time
+    dag.add("constructive", lambda transcript_notes: cached_stage(
+        video_data["video_id"], "constructive", [video_data["title"], useful_video_data(transcript_notes)],
+        lambda: generate_constructive_feedback(video_data, useful_video_data(transcript_notes))), deps=["transcript_notes"])
+    dag.add("roast", lambda transcript_notes: cached_stage(
+        video_data["video_id"], "roast", [video_data["title"], useful_video_data(transcript_notes)],
+        lambda: generate_roast(video_data, useful_video_data(transcript_notes))), deps=["transcript_notes"])
+    return dag.run(llm_executor)
@@ -0,0 +1,32 @@
+import time
+import threading
+
+# Deliberate copy of TokenBucket from episode-001-web_scraping/rate_limit.py. Each episode runs on its own
+# from its folder with no shared package to import from, so keep the two in sync by hand.
+
+
+class TokenBucket:
+    # Thread-safe token bucket, allows bursts of up to `capacity` then refills at `rate` tokens per second
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1):
+        # Block until `tokens` are available, then take them
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
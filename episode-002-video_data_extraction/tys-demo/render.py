@@ -0,0 +1,193 @@
+import os
+import argparse
+import tempfile
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from chunking import chunk_transcript, has_timestamps, link_timestamps
+from transcript_store import TranscriptStore, DEFAULT_STORE_PATH
+
+output_env = os.getenv("OUTPUT_DIR")
+output_dir = os.path.expanduser(output_env)
+
+# Notes rendered per task when rebuilding the vault, bigger batches mean less back and forth between processes
+REBUILD_BATCH_SIZE = 100
+# Stage outputs each note is made from
+MODE_STAGES = {
+    "summary": ("tldr", "one_key_takeaway", "key_takeaways", "summary"),
+    "roast": ("constructive", "roast"),
+}
+
+
+def create_markdown_with_frontmatter(summary, video_data, processed_date):
+    frontmatter = f"""---
+title: "{video_data['title']}"
+channel_name: "{video_data['channel_name']}"
+view_count: "{video_data['view_count']}"
+publish_date: "{video_data['publish_date']}"
+processed_date: "{processed_date.isoformat()}"
+description: "{video_data['description']}"
+---
+
+## {video_data['channel_name']}
+Published: {datetime.fromisoformat(video_data['publish_date']).strftime('%B %d, %Y')}, Processed: {processed_date.strftime('%B %d, %Y')}
+
+[![Thumbnail]({video_data['thumbnail']})]({video_data['video_url']})
+
+{summary}
+"""
+    return frontmatter
+
+
+def render_summary(video_data, outputs, processed_date):
+    tldr = outputs["tldr"]
+    one_key_takeaway = outputs["one_key_takeaway"]
+    key_takeaways = outputs["key_takeaways"]
+    summary = outputs["summary"]
+    # With timed segments the transcript gets a [m:ss] marker about every minute, which are linked below
+    chunks = chunk_transcript(video_data)
+    transcript = '\n\n'.join(chunk['text'] for chunk in chunks) if has_timestamps(chunks) else video_data['transcript']
+
+
+    md_data = f"""
+{"## TLDR" if not tldr.lower().startswith("tldr") else ""}
+{tldr}
+
+## Most useful takeaway
+**{one_key_takeaway}**
+
+## All key takeaways
+{key_takeaways}
+
+## Summary
+{summary}
+
+## Transcript
+{transcript}
+    """
+
+    return create_markdown_with_frontmatter(link_timestamps(md_data, video_data['video_id']), video_data, processed_date)
+
+
+def render_roast(video_data, outputs, processed_date):
+    constructive = outputs["constructive"]
+    roast = outputs["roast"]
+
+    md_data = f"""
+## {video_data['channel_name']}
+### Views: {video_data["view_count"]}
+### Likes: {video_data["like_count"]}
+### Comments: {video_data["comment_count"]}
+### Duration: {video_data["duration"]}
+Published: {datetime.fromisoformat(video_data['publish_date']).strftime('%B %d, %Y')}, Processed: {processed_date.strftime('%B %d, %Y')}
+
+[![Thumbnail]({video_data['thumbnail']})]({video_data['video_url']})
+
+## Constructive Feedback
+{constructive}
+
+## ROAST 🔥
+{roast}
+    """
+    return link_timestamps(md_data, video_data['video_id'])
+
+
+def render_markdown(video_data, mode, outputs, processed_at=None):
+    # processed_at is when the video was processed (epoch seconds), now if it's being processed right now
+    processed_date = datetime.fromtimestamp(processed_at) if processed_at is not None else datetime.now()
+    renderer = render_roast if mode == "roast" else render_summary
+    return renderer(video_data, outputs, processed_date)
+
+
+def _read_umask():
+    # os.umask can only be read by setting it, done once at import before any worker threads exist
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Mode new notes get, what a plain open() would create. mkstemp makes its files 0600.
+NEW_FILE_MODE = 0o666 & ~_read_umask()
+
+
+def file_mode(path):
+    # The mode of the note being replaced, or NEW_FILE_MODE for a new one
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return NEW_FILE_MODE
+
+
+def write_atomic(path, content):
+    # Write to a temp file in the same directory and rename it over the target, so a crash never leaves a half written note
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            os.fchmod(tmp_file.fileno(), file_mode(path))
+            # On disk before the rename, otherwise a crash can leave the new name pointing at an empty file
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def markdown_path(video_data, store):
+    # Notes are named after the title. If another video already has that file, the video_id is added to the name.
+    md_filename = video_data['title'][:100]  # Limit length to first 100 characters
+    md_filename = ''.join(c if c.isalnum() or c in [' ', '-', '_'] else '_' for c in md_filename).strip()
+    md_file_path = os.path.join(output_dir, md_filename + ".md")
+    if not store.claim_output_path(md_file_path, video_data['video_id']):
+        md_file_path = os.path.join(output_dir, f"{md_filename} ({video_data['video_id']}).md")
+        store.claim_output_path(md_file_path, video_data['video_id'])
+    return md_file_path
+
+
+def write_markdown(video_data, mode, outputs, store, processed_at=None):
+    # Renders the note and writes it, returns the path it was written to
+    md_file_path = markdown_path(video_data, store)
+    write_atomic(md_file_path, render_markdown(video_data, mode, outputs, processed_at))
+    return md_file_path
+
+
+_worker_store = None
+
+
+def _rebuild_batch(store_path, jobs):
+    # Runs in a worker process, with its own connection to the store. Workers only need this module, which
+    # has no setup at import, so with the spawn start method they don't redo main.py's OAuth and API setup.
+    global _worker_store
+    if _worker_store is None:
+        _worker_store = TranscriptStore(store_path)
+    written = 0
+    for video_id, mode, processed_at in jobs:
+        video_data = _worker_store.get(video_id)
+        outputs = _worker_store.get_stage_outputs(video_id)
+        if video_data is None or any(stage not in outputs for stage in MODE_STAGES[mode]):
+            print(f"⚠️  Skipping {video_id}, its {mode} hasn't been generated")
+            continue
+        # Keeps the date it was processed, a rebuild isn't processing it again
+        write_markdown(video_data, mode, outputs, _worker_store, processed_at)
+        written += 1
+    return written
+
+
+def rebuild_vault(store_path=DEFAULT_STORE_PATH, max_workers=None):
+    # Re-renders every processed video's note from the saved stage outputs, no LLM calls, spread over all cores
+    os.makedirs(output_dir, exist_ok=True)
+    store = TranscriptStore(store_path)
+    jobs = store.rendered_outputs()
+    batches = [jobs[i:i + REBUILD_BATCH_SIZE] for i in range(0, len(jobs), REBUILD_BATCH_SIZE)]
+    print(f"\n🏗️  Rebuilding {len(jobs)} notes in {output_dir}\n")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        written = sum(executor.map(_rebuild_batch, [store_path] * len(batches), batches))
+    print(f"✅ Rebuilt {written} notes")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the markdown notes from the transcript store")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes (default: one per core)")
+    args = parser.parse_args()
+    rebuild_vault(max_workers=args.workers)
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import argparse
+import threading
+from segments import TranscriptSegments, MAGIC
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+transcripts_dir = os.path.join(base_dir, "experiments", "youtube", "transcripts")
+
+# One SQLite file holds every transcript and its pipeline state
+DEFAULT_STORE_PATH = os.path.join(transcripts_dir, "transcripts.sqlite")
+# Pipeline states a video can be in
+STATES = ("unprocessed", "processed", "failed")
+# Fields kept in their own (indexed) columns, everything else in the video data goes in the metadata JSON
+COLUMNS = ("video_id", "channel_id", "channel_name", "title")
+
+
+class TranscriptStore:
+    # Transcripts and video metadata in SQLite. Transcripts are zlib compressed, and indexed for full-text
+    # search together with the title in a contentless FTS5 table (so the text isn't stored twice).
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                channel_id TEXT,
+                channel_name TEXT,
+                title TEXT,
+                metadata TEXT NOT NULL,
+                transcript BLOB,
+                segments BLOB,
+                state TEXT NOT NULL DEFAULT 'unprocessed',
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Stores created before segments were kept don't have the column yet
+        if "segments" not in [row[1] for row in self._conn.execute("PRAGMA table_info(videos)")]:
+            self._conn.execute("ALTER TABLE videos ADD COLUMN segments BLOB")
+        # Manifest of what each processing stage produced for a video, keyed by a hash of the stage's inputs
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS stage_outputs (
+                video_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                output TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (video_id, stage)
+            )
+        """)
+        # Which video each markdown file belongs to, so two videos never write to the same file
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS output_files (
+                path TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS videos_state ON videos (state)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS videos_channel_id ON videos (channel_id)")
+        try:
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(title, transcript, content='')")
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            print("⚠️  This SQLite build doesn't have FTS5, transcript search is disabled")
+            self.has_fts = False
+        self._conn.commit()
+
+    def _load_segments(self, data, transcript):
+        if not data:
+            return TranscriptSegments()
+        if data.startswith(MAGIC):
+            return TranscriptSegments.from_bytes(data, transcript)
+        # Saved as a JSON list of {'text', 'start', 'duration'} by earlier versions
+        return TranscriptSegments.from_entries(json.loads(zlib.decompress(data)))
+
+    def _row_to_video(self, row):
+        video_id, channel_id, channel_name, title, metadata, transcript, segments, state, error = row
+        video = json.loads(metadata)
+        transcript = zlib.decompress(transcript).decode("utf-8") if transcript else ""
+        video.update(
+            video_id=video_id,
+            channel_id=channel_id,
+            channel_name=channel_name,
+            title=title,
+            transcript=transcript,
+            segments=self._load_segments(segments, transcript),
+            state=state,
+            error=error,
+        )
+        return video
+
+    def upsert(self, video, state="unprocessed"):
+        # Saves the video data (the same dict that used to go in the JSON files, plus the timed transcript
+        # segments if there are any), replacing any earlier copy
+        metadata = {key: value for key, value in video.items() if key not in COLUMNS + ("transcript", "segments", "state", "error")}
+        segments = video.get("segments")
+        if isinstance(segments, list):
+            segments = TranscriptSegments.from_entries(segments)
+        if segments is not None and len(segments):
+            # The transcript is the segment texts joined, so only the timings are stored with it (their
+            # offsets point into this text, so it has to be exactly segments.text)
+            transcript = segments.text
+        else:
+            transcript = video.get("transcript") or ""
+        with self._lock, self._conn:
+            old = self._conn.execute(
+                "SELECT rowid, title, transcript FROM videos WHERE video_id = ?", (video["video_id"],)
+            ).fetchone()
+            if old and self.has_fts:
+                # Contentless FTS tables need the old values to remove a row from the index
+                self._conn.execute(
+                    "INSERT INTO videos_fts (videos_fts, rowid, title, transcript) VALUES ('delete', ?, ?, ?)",
+                    (old[0], old[1] or "", zlib.decompress(old[2]).decode("utf-8") if old[2] else ""),
+                )
+            self._conn.execute(
+                """INSERT INTO videos (video_id, channel_id, channel_name, title, metadata, transcript, segments, state, error, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)
+                   ON CONFLICT (video_id) DO UPDATE SET
+                       channel_id = excluded.channel_id, channel_name = excluded.channel_name, title = excluded.title,
+                       metadata = excluded.metadata, transcript = excluded.transcript, segments = excluded.segments, state = excluded.state,
+                       error = NULL, updated_at = excluded.updated_at""",
+                (
+                    video["video_id"],
+                    video.get("channel_id"),
+                    video.get("channel_name"),
+                    video.get("title"),
+                    json.dumps(metadata, ensure_ascii=False, separators=(",", ":")),
+                    zlib.compress(transcript.encode("utf-8")),
+                    segments.to_bytes() if segments is not None and len(segments) else None,
+                    state,
+                    time.time(),
+                ),
+            )
+            if self.has_fts:
+                rowid = self._conn.execute("SELECT rowid FROM videos WHERE video_id = ?", (video["video_id"],)).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO videos_fts (rowid, title, transcript) VALUES (?, ?, ?)",
+                    (rowid, video.get("title") or "", transcript),
+                )
+
+    def get(self, video_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT video_id, channel_id, channel_name, title, metadata, transcript, segments, state, error FROM videos WHERE video_id = ?",
+                (video_id,),
+            ).fetchone()
+        return self._row_to_video(row) if row else None
+
+    def _video_ids(self, where, params):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT video_id FROM videos WHERE {where} ORDER BY updated_at", params)]
+
+    def ids_by_state(self, state):
+        return self._video_ids("state = ?", (state,))
+
+    def iter_by_state(self, state):
+        # Ids are read up front, so the caller can change states while iterating
+        for video_id in self.ids_by_state(state):
+            video = self.get(video_id)
+            if video:
+                yield video
+
+    def by_channel(self, channel_id):
+        return [self.get(video_id) for video_id in self._video_ids("channel_id = ?", (channel_id,))]
+
+    def set_state(self, video_id, state, error=None):
+        if state not in STATES:
+            raise ValueError(f"Unknown state '{state}', expected one of: {', '.join(STATES)}")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE videos SET state = ?, error = ?, updated_at = ? WHERE video_id = ?",
+                (state, error, time.time(), video_id),
+            )
+
+    def get_stage_output(self, video_id, stage, input_hash):
+        # Returns the stage's saved output if it was produced from the same inputs, otherwise None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM stage_outputs WHERE video_id = ? AND stage = ? AND input_hash = ?",
+                (video_id, stage, input_hash),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_stage_output(self, video_id, stage, input_hash, output):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stage_outputs (video_id, stage, input_hash, output, created_at) VALUES (?, ?, ?, ?, ?)",
+                (video_id, stage, input_hash, output, time.time()),
+            )
+
+    def get_stage_outputs(self, video_id):
+        # The latest output of every stage of the video, whatever inputs it was made from
+        with self._lock:
+            return dict(self._conn.execute("SELECT stage, output FROM stage_outputs WHERE video_id = ?", (video_id,)))
+
+    def rendered_outputs(self):
+        # (video_id, mode, processed_at) of every processed video's note, using the mode it was last rendered in
+        # and the time it was (epoch seconds)
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT stage_outputs.video_id, stage_outputs.stage, stage_outputs.created_at FROM stage_outputs
+                   JOIN videos ON videos.video_id = stage_outputs.video_id
+                   WHERE substr(stage_outputs.stage, -9) = '_markdown' AND videos.state = 'processed'
+                   ORDER BY stage_outputs.created_at"""
+            ).fetchall()
+        return list({video_id: (video_id, stage[:-len("_markdown")], created_at) for video_id, stage, created_at in rows}.values())
+
+    def claim_output_path(self, path, video_id):
+        # Returns True if the file is free or already belongs to this video, False if another video has it
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO output_files (path, video_id) VALUES (?, ?)", (path, video_id))
+            owner = self._conn.execute("SELECT video_id FROM output_files WHERE path = ?", (path,)).fetchone()[0]
+        return owner == video_id
+
+    def search(self, query, limit=20):
+        # Full-text search over titles and transcripts (FTS5 query syntax), best matches first
+        if not self.has_fts:
+            raise RuntimeError("Transcript search needs an SQLite build with FTS5")
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT videos.video_id, videos.title, videos.channel_name, videos.state FROM videos_fts
+                   JOIN videos ON videos.rowid = videos_fts.rowid
+                   WHERE videos_fts MATCH ? ORDER BY rank LIMIT ?""",
+                (query, limit),
+            ).fetchall()
+        return [{"video_id": row[0], "title": row[1], "channel_name": row[2], "state": row[3]} for row in rows]
+
+    def counts(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM videos GROUP BY state"))
+        return {state: counts.get(state, 0) for state in STATES}
+
+    def close(self):
+        self._conn.close()
+
+
+def import_json_dir(store, directory, state):
+    # Loads the JSON files the pipeline used to write (one per video) into the store
+    if not os.path.isdir(directory):
+        return 0
+    imported = 0
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                video = json.load(f)
+            video.setdefault("video_id", filename[:-len(".json")])
+            store.upsert(video, state=state)
+            imported += 1
+        except Exception as e:
+            print(f"❌ Error importing {filename}: {str(e)}")
+    return imported
+
+
+def import_json_transcripts(store):
+    for state in ("unprocessed", "processed"):
+        imported = import_json_dir(store, os.path.join(transcripts_dir, state), state)
+        print(f"📥 Imported {imported} {state} transcripts")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcript store")
+    parser.add_argument("command", choices=["import", "search", "stats"], help="import the old JSON files, search transcripts, or count videos by state")
+    parser.add_argument("query", nargs='*', help="Search query")
+    parser.add_argument("--limit", type=int, default=20, help="Max search results (default: 20)")
+    args = parser.parse_args()
+
+    store = TranscriptStore()
+    if args.command == "import":
+        import_json_transcripts(store)
+    elif args.command == "search":
+        for result in store.search(' '.join(args.query), limit=args.limit):
+            print(f"🎥 {result['title']} ({result['channel_name']}) - https://www.youtube.com/watch?v={result['video_id']} [{result['state']}]")
+    print(f"📊 {store.counts()}")
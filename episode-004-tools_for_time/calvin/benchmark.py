@@ -0,0 +1,152 @@
+import time
+from datetime import datetime, timedelta
+import pytz
+from cal import CalendarManager
+from event_mirror import EventMirror
+from fake_calendar import make_synthetic_calendar
+
+# Simulated round trip to the Calendar API per request
+FAKE_API_LATENCY = 0.05
+# (number of events, number of days) of the synthetic calendars
+CALENDAR_SIZES = [(300, 30), (3000, 30), (10000, 90)]
+# Today, so the synthetic events fall inside the event mirror's window
+START_DATE = datetime.now().strftime("%Y-%m-%d")
+# Agent turns simulated in the mirror benchmark, each one a search, a free time lookup and an event lookup
+MIRROR_TURNS = 20
+# Events created and then deleted in the bulk benchmark, about a semester of classes
+BULK_EVENTS = 150
+
+
+def legacy_get_free_time(manager, start_date, end_date, day_start='08:00', day_end='22:00'):
+    # The previous implementation: one events().list per day, then every event subtracted from every slot.
+    # Kept here as the baseline, and to check the new one gives the same answers.
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    timezone = pytz.timezone(manager.TIME_ZONE)
+    free_time = {}
+    while start <= end:
+        date_str = start.strftime('%Y-%m-%d')
+        day_start_time = timezone.localize(datetime.strptime(f"{date_str} {day_start}", '%Y-%m-%d %H:%M'))
+        day_end_time = timezone.localize(datetime.strptime(f"{date_str} {day_end}", '%Y-%m-%d %H:%M'))
+        events_result = manager.service.events().list(
+            calendarId='primary',
+            timeMin=day_start_time.isoformat(),
+            timeMax=day_end_time.isoformat(),
+            singleEvents=True,
+            orderBy='startTime',
+            maxResults=2500
+        ).execute()
+        free_slots = [(day_start_time, day_end_time)]
+        for event in events_result.get('items', []):
+            event_start = manager._parse_datetime(event['start'].get('dateTime', event['start'].get('date')))
+            event_end = manager._parse_datetime(event['end'].get('dateTime', event['end'].get('date')))
+            new_free_slots = []
+            for slot_start, slot_end in free_slots:
+                if event_start <= slot_start and event_end >= slot_end:
+                    continue
+                elif event_start > slot_start and event_end < slot_end:
+                    new_free_slots.append((slot_start, event_start))
+                    new_free_slots.append((event_end, slot_end))
+                elif event_start <= slot_start < event_end:
+                    new_free_slots.append((event_end, slot_end))
+                elif event_start < slot_end <= event_end:
+                    new_free_slots.append((slot_start, event_start))
+                else:
+                    new_free_slots.append((slot_start, slot_end))
+            free_slots = new_free_slots
+        if free_slots:
+            free_time[date_str] = manager._consolidate_slots(free_slots)
+        start += timedelta(days=1)
+    return manager._format_free_time(free_time)
+
+
+def benchmark_get_free_time():
+    print(f"\n⏱️  get_free_time over synthetic calendars, {FAKE_API_LATENCY * 1000:.0f}ms simulated latency per request\n")
+    for num_events, days in CALENDAR_SIZES:
+        service = make_synthetic_calendar(num_events, START_DATE, days, latency=FAKE_API_LATENCY)
+        manager = CalendarManager(service)
+        end_date = (datetime.strptime(START_DATE, '%Y-%m-%d') + timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+        results = {}
+        for name, fn in [("per-day", legacy_get_free_time), ("range", CalendarManager.get_free_time)]:
+            service.requests = 0
+            start_time = time.time()
+            results[name] = fn(manager, START_DATE, end_date)
+            elapsed = time.time() - start_time
+            print(f"{num_events:>6} events / {days:>3} days  {name:<8} {elapsed:7.2f}s  {service.requests:>4} requests")
+        assert results["per-day"] == results["range"], "free time differs from the per-day implementation"
+
+        # Without the simulated latency, to see the slot computation itself
+        service.latency = 0
+        for name, fn in [("per-day", legacy_get_free_time), ("range", CalendarManager.get_free_time)]:
+            start_time = time.time()
+            fn(manager, START_DATE, end_date)
+            print(f"{'':>24}{name:<8} {(time.time() - start_time) * 1000:7.1f}ms  without latency")
+
+
+def benchmark_event_mirror():
+    print(f"\n⏱️  Reads served live vs from the local mirror, {MIRROR_TURNS} turns of search + free time + lookup\n")
+    num_events, days = CALENDAR_SIZES[1]
+    service = make_synthetic_calendar(num_events, START_DATE, days, latency=FAKE_API_LATENCY)
+    end_date = (datetime.strptime(START_DATE, '%Y-%m-%d') + timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    search_from = pytz.timezone("America/Los_Angeles").localize(datetime.strptime(START_DATE, '%Y-%m-%d'))
+    event_ids = list(service.stored_events)
+
+    def live_turn(manager, turn):
+        service.events().list(calendarId='primary', timeMin=search_from.isoformat(), maxResults=10,
+                              singleEvents=True, orderBy='startTime', q=f"Event {turn}").execute()
+        manager.get_free_time(START_DATE, end_date)
+        return service.events().get(calendarId='primary', eventId=event_ids[turn]).execute()
+
+    def mirror_turn(manager, turn):
+        # Forced sync, as if every turn came after the mirror went stale
+        manager.mirror.sync(force=True)
+        manager.mirror.search(f"Event {turn}", search_from, 10)
+        manager.get_free_time(START_DATE, end_date)
+        return manager.mirror.get(event_ids[turn])
+
+    mirror = EventMirror(service, ":memory:")
+    service.requests = 0
+    start_time = time.time()
+    mirror.sync()
+    print(f"{'initial sync':<14} {time.time() - start_time:7.2f}s  {service.requests:>4} requests")
+
+    for name, manager, turn_fn in [("live", CalendarManager(service), live_turn),
+                                   ("mirror", CalendarManager(service, mirror), mirror_turn)]:
+        service.requests = 0
+        start_time = time.time()
+        for turn in range(MIRROR_TURNS):
+            turn_fn(manager, turn)
+        print(f"{name:<14} {time.time() - start_time:7.2f}s  {service.requests:>4} requests")
+
+
+def benchmark_bulk_events():
+    print(f"\n⏱️  Creating and deleting {BULK_EVENTS} events one request each vs in batches\n")
+    start = datetime.strptime(START_DATE, '%Y-%m-%d')
+    events = [{
+        "summary": f"Class {i}",
+        "start_time": (start + timedelta(days=i, hours=9)).strftime('%Y-%m-%d %H:%M'),
+        "end_time": (start + timedelta(days=i, hours=10)).strftime('%Y-%m-%d %H:%M'),
+    } for i in range(BULK_EVENTS)]
+
+    def one_by_one(manager):
+        for event_data in events:
+            manager.create_event(**event_data)
+        for event_id in list(manager.service.stored_events):
+            manager.service.events().delete(calendarId='primary', eventId=event_id).execute()
+
+    def batched(manager):
+        manager.create_multiple_events(events)
+        manager.delete_multiple_events(list(manager.service.stored_events))
+
+    for name, fn in [("one by one", one_by_one), ("batched", batched)]:
+        service = make_synthetic_calendar(0, START_DATE, 1, latency=FAKE_API_LATENCY)
+        start_time = time.time()
+        fn(CalendarManager(service))
+        print(f"{name:<14} {time.time() - start_time:7.2f}s  {service.requests:>4} requests")
+
+
+if __name__ == "__main__":
+    benchmark_get_free_time()
+    benchmark_event_mirror()
+    benchmark_bulk_events()
@@ -2,14 +2,19 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+import google_auth_httplib2
+import httplib2
 import os.path
 import datetime
+import threading
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
 from rich import box
 from datetime import datetime, timedelta 
 import pytz
+from event_mirror import EventMirror
 
 console = Console()
 
@@ -17,6 +22,12 @@ TIME_ZONE = "America/Los_Angeles"
 
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# Most calls the Calendar API accepts in one batch request
+MAX_BATCH_SIZE = 50
+
+# Serve searches, free time and event lookups from a local copy of the calendar kept in sync with Google
+USE_EVENT_MIRROR = True
+
 def authenticate():
     creds = None
     if os.path.exists('token.json'):
@@ -29,35 +40,25 @@ def authenticate():
             creds = flow.run_local_server(port=0)
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
+    # httplib2 connections aren't thread-safe, so every request gets its own, letting tools run in parallel
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http()), *args, **kwargs)
+
     # return the service object
-    service = build('calendar', 'v3', credentials=creds)
+    service = build('calendar', 'v3', credentials=creds, requestBuilder=build_request)
     return service
 class CalendarManager:
-    def __init__(self, service):
+    def __init__(self, service, mirror=None):
         self.service = service
         self.TIME_ZONE = "America/Los_Angeles" 
+        # Optional EventMirror, reads go to it and writes update it after going through to the API
+        self.mirror = mirror
     def create_event(self, summary, start_time, end_time, location=None, description=None):
-        start_datetime = datetime.strptime(start_time, "%Y-%m-%d %H:%M") 
-        end_datetime = datetime.strptime(end_time, "%Y-%m-%d %H:%M") 
-
-        event = {
-            'summary': summary,
-            'start': {
-                'dateTime': start_datetime.isoformat(),
-                'timeZone': self.TIME_ZONE,
-            },
-            'end': {
-                'dateTime': end_datetime.isoformat(),
-                'timeZone': self.TIME_ZONE,
-            },
-        }
-
-        if location:
-            event['location'] = location
-        if description:
-            event['description'] = description
+        event = self._event_body(summary, start_time, end_time, location, description)
 
         event = self.service.events().insert(calendarId='primary', body=event).execute()
+        if self.mirror:
+            self.mirror.put(event)
         
         table = Table(title="Event Created", box=box.ROUNDED)
         table.add_column("Field", style="cyan")
@@ -76,17 +77,41 @@ class CalendarManager:
         
         return f'Event created: {event.get("summary")} starting at {event["start"]["dateTime"]}. Link: {event.get("htmlLink")}'
 
-    def edit_event(self, event_id, summary=None, location=None, description=None):
-        event = self.service.events().get(calendarId='primary', eventId=event_id).execute()
+    def _event_body(self, summary, start_time, end_time, location=None, description=None):
+        start_datetime = datetime.strptime(start_time, "%Y-%m-%d %H:%M") 
+        end_datetime = datetime.strptime(end_time, "%Y-%m-%d %H:%M") 
+
+        event = {
+            'summary': summary,
+            'start': {
+                'dateTime': start_datetime.isoformat(),
+                'timeZone': self.TIME_ZONE,
+            },
+            'end': {
+                'dateTime': end_datetime.isoformat(),
+                'timeZone': self.TIME_ZONE,
+            },
+        }
 
-        if summary:
-            event['summary'] = summary
         if location:
             event['location'] = location
         if description:
             event['description'] = description
+        return event
 
-        updated_event = self.service.events().update(calendarId='primary', eventId=event_id, body=event).execute()
+    def edit_event(self, event_id, summary=None, location=None, description=None):
+        # Only the changed fields are sent, so edits made elsewhere to the rest of the event are kept
+        changes = {}
+        if summary:
+            changes['summary'] = summary
+        if location:
+            changes['location'] = location
+        if description:
+            changes['description'] = description
+
+        updated_event = self.service.events().patch(calendarId='primary', eventId=event_id, body=changes).execute()
+        if self.mirror:
+            self.mirror.put(updated_event)
         
         table = Table(title="Event Updated", box=box.ROUNDED)
         table.add_column("Field", style="cyan")
@@ -106,11 +131,14 @@ class CalendarManager:
         return f'Event updated: {updated_event["htmlLink"]}'
 
     def search_events(self, query, max_results=10):
-        time_min = datetime.utcnow().isoformat() + 'Z'
-        events_result = self.service.events().list(calendarId='primary', timeMin=time_min,
-                                            maxResults=max_results, singleEvents=True,
-                                            orderBy='startTime', q=query).execute()
-        events = events_result.get('items', [])
+        # The mirror answers when it has all the results, otherwise (None) the API does
+        events = self.mirror.search(query, datetime.now(pytz.utc), max_results) if self.mirror else None
+        if events is None:
+            time_min = datetime.utcnow().isoformat() + 'Z'
+            events_result = self.service.events().list(calendarId='primary', timeMin=time_min,
+                                                maxResults=max_results, singleEvents=True,
+                                                orderBy='startTime', q=query).execute()
+            events = events_result.get('items', [])
 
         if not events:
             console.print(Panel("No upcoming events found.", title="Search Results", border_style="yellow"))
@@ -131,34 +159,64 @@ class CalendarManager:
 
     def delete_event(self, event_id):
         self.service.events().delete(calendarId='primary', eventId=event_id).execute()
+        if self.mirror:
+            self.mirror.remove(event_id)
         console.print(Panel(f"Event with ID {event_id} has been deleted.", title="Event Deleted", border_style="red"))
         return 'Event deleted'
 
     def create_multiple_events(self, events):
+        # All the inserts go out in batch requests of up to MAX_BATCH_SIZE, and the results are shown in one table
+        bodies = []
+        results = [None] * len(events)
+        for i, event_data in enumerate(events):
+            try:
+                bodies.append((i, self._event_body(**event_data)))
+            except (TypeError, ValueError) as e:
+                results[i] = (None, e)
+        responses = self._execute_batch([self.service.events().insert(calendarId='primary', body=body)
+                                         for _, body in bodies])
+        for (i, _), response in zip(bodies, responses):
+            results[i] = response
+
+        table = Table(title="Multiple Events Created", box=box.ROUNDED)
+        table.add_column("Status", style="cyan")
+        table.add_column("Summary", style="magenta")
+        table.add_column("Start", style="green")
+        table.add_column("Result", style="green")
+
         created_events = []
-        for event_data in events:
-            result = self.create_event(**event_data)
-            created_events.append(result)
-        
-        
-        for event in created_events:
-            parts = event.split(". Link: ")
-            if len(parts) == 2:
-                summary_and_start, link = parts
-                summary, start_time = summary_and_start.split(" starting at ")
-                summary = summary.split(": ")[1] 
-        return f"{len(created_events)} events created successfully."
+        failed_creations = []
+        for event_data, (event, error) in zip(events, results):
+            if error is None:
+                if self.mirror:
+                    self.mirror.put(event)
+                created_events.append(event)
+                table.add_row("Created", event.get("summary"), event["start"]["dateTime"], event.get("htmlLink"))
+            else:
+                failed_creations.append((event_data, error))
+                table.add_row("Failed", str(event_data.get("summary")), str(event_data.get("start_time")), str(error))
+
+        console.print(table)
+
+        message = f"{len(created_events)} events created successfully."
+        if failed_creations:
+            message += f" {len(failed_creations)} failed: " + "; ".join(
+                f"{event_data.get('summary')} ({error})" for event_data, error in failed_creations)
+        return message
 
     def delete_multiple_events(self, event_ids):
         deleted_events = []
         failed_deletions = []
 
-        for event_id in event_ids:
-            try:
-                self.service.events().delete(calendarId='primary', eventId=event_id).execute()
+        responses = self._execute_batch([self.service.events().delete(calendarId='primary', eventId=event_id)
+                                         for event_id in event_ids])
+        for event_id, (_, error) in zip(event_ids, responses):
+            if error is None:
+                if self.mirror:
+                    self.mirror.remove(event_id)
                 deleted_events.append(event_id)
-            except Exception as e:
-                failed_deletions.append((event_id, str(e)))
+            else:
+                failed_deletions.append((event_id, str(error)))
 
         table = Table(title="Multiple Events Deleted", box=box.ROUNDED)
         table.add_column("Status", style="cyan")
@@ -177,62 +235,108 @@ class CalendarManager:
         fail_count = len(failed_deletions)
         return f"{success_count} events deleted successfully. {fail_count} deletions failed."
 
+    def _execute_batch(self, requests):
+        # Sends the requests in batches of up to MAX_BATCH_SIZE, returns a (response, exception) per request,
+        # in order. A failed call only fails its own item, the rest of the batch still goes through.
+        results = [None] * len(requests)
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        for batch_start in range(0, len(requests), MAX_BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for i in range(batch_start, min(batch_start + MAX_BATCH_SIZE, len(requests))):
+                batch.add(requests[i], request_id=str(i))
+            try:
+                batch.execute()
+            except Exception as e:
+                # The whole batch request failed, so did every call in it that has no result
+                for i in range(batch_start, min(batch_start + MAX_BATCH_SIZE, len(requests))):
+                    if results[i] is None:
+                        results[i] = (None, e)
+        return results
+
     def get_free_time(self, start_date, end_date, day_start='08:00', day_end='22:00'):
-        # Convert start_date and end_date to datetime objects
-        start = datetime.strptime(start_date, '%Y-%m-%d')
-        end = datetime.strptime(end_date, '%Y-%m-%d')
-        
         # Get the timezone
         timezone = pytz.timezone(self.TIME_ZONE)
-        
-        free_time = {}
 
+        # The day_start to day_end window of every day in the range
+        windows = []
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
         while start <= end:
             date_str = start.strftime('%Y-%m-%d')
             day_start_time = timezone.localize(datetime.strptime(f"{date_str} {day_start}", '%Y-%m-%d %H:%M'))
             day_end_time = timezone.localize(datetime.strptime(f"{date_str} {day_end}", '%Y-%m-%d %H:%M'))
-
-            # Get events for the day
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=day_start_time.isoformat(),
-                timeMax=day_end_time.isoformat(),
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            events = events_result.get('items', [])
-
-            # Initialize free time slots
-            free_slots = [(day_start_time, day_end_time)]
-
-            # Adjust free time based on events
-            for event in events:
-                event_start = self._parse_datetime(event['start'].get('dateTime', event['start'].get('date')))
-                event_end = self._parse_datetime(event['end'].get('dateTime', event['end'].get('date')))
-                
-                new_free_slots = []
-                for slot_start, slot_end in free_slots:
-                    if event_start <= slot_start and event_end >= slot_end:
-                        continue
-                    elif event_start > slot_start and event_end < slot_end:
-                        new_free_slots.append((slot_start, event_start))
-                        new_free_slots.append((event_end, slot_end))
-                    elif event_start <= slot_start < event_end:
-                        new_free_slots.append((event_end, slot_end))
-                    elif event_start < slot_end <= event_end:
-                        new_free_slots.append((slot_start, event_start))
-                    else:
-                        new_free_slots.append((slot_start, slot_end))
-                free_slots = new_free_slots
+            windows.append((date_str, day_start_time, day_end_time))
+            start += timedelta(days=1)
+        if not windows:
+            return ''
+
+        # One query for the whole range instead of one per day, merged into sorted, non-overlapping busy intervals
+        events = self._list_events(windows[0][1], windows[-1][2])
+        busy = self._merge_intervals(
+            (self._parse_datetime(event['start'].get('dateTime', event['start'].get('date'))),
+             self._parse_datetime(event['end'].get('dateTime', event['end'].get('date'))))
+            for event in events
+        )
+
+        # Sweep the days and the busy intervals together, the free slots are the gaps in each day's window
+        free_time = {}
+        first_busy = 0
+        for date_str, day_start_time, day_end_time in windows:
+            while first_busy < len(busy) and busy[first_busy][1] <= day_start_time:
+                first_busy += 1
+            free_slots = []
+            free_from = day_start_time
+            i = first_busy
+            while i < len(busy) and busy[i][0] < day_end_time:
+                if busy[i][0] > free_from:
+                    free_slots.append((free_from, busy[i][0]))
+                free_from = max(free_from, busy[i][1])
+                i += 1
+            if free_from < day_end_time:
+                free_slots.append((free_from, day_end_time))
 
             # Consolidate free time slots
             if free_slots:
                 free_time[date_str] = self._consolidate_slots(free_slots)
 
-            start += timedelta(days=1)
-
         return self._format_free_time(free_time)
 
+    def _list_events(self, time_min, time_max):
+        # All events overlapping [time_min, time_max], from the mirror if the range is in its window, otherwise
+        # following nextPageToken
+        if self.mirror:
+            events = self.mirror.events_between(time_min, time_max)
+            if events is not None:
+                return events
+        events = []
+        page_token = None
+        while True:
+            events_result = self.service.events().list(
+                calendarId='primary',
+                timeMin=time_min.isoformat(),
+                timeMax=time_max.isoformat(),
+                singleEvents=True,
+                orderBy='startTime',
+                maxResults=2500,
+                pageToken=page_token
+            ).execute()
+            events.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return events
+
+    def _merge_intervals(self, intervals):
+        merged = []
+        for interval_start, interval_end in sorted(intervals):
+            if merged and interval_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], interval_end))
+            else:
+                merged.append((interval_start, interval_end))
+        return merged
+
     def _consolidate_slots(self, slots):
         consolidated = []
         for slot in sorted(slots):
@@ -255,9 +359,17 @@ class CalendarManager:
             return pytz.timezone(self.TIME_ZONE).localize(dt)
         return dt.astimezone(pytz.timezone(self.TIME_ZONE))
 
-# This function creates and returns the CalendarManager instance
-def get_calendar_manager():
-    service = authenticate()
-    return CalendarManager(service)
+_calendar_manager = None
+_calendar_manager_lock = threading.Lock()
 
-calendar_manager = get_calendar_manager()
+# This function creates and returns the CalendarManager instance, authenticating the first time it's called.
+# Tools run in parallel threads, the lock makes sure only one of them authenticates.
+def get_calendar_manager():
+    global _calendar_manager
+    if _calendar_manager is None:
+        with _calendar_manager_lock:
+            if _calendar_manager is None:
+                service = authenticate()
+                mirror = EventMirror(service, time_zone=TIME_ZONE) if USE_EVENT_MIRROR else None
+                _calendar_manager = CalendarManager(service, mirror)
+    return _calendar_manager
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+import pytz
+
+# Where the mirror lives on disk
+DEFAULT_MIRROR_PATH = os.path.expanduser("~/.cache/tool-use/calendar_mirror.sqlite")
+# Reads within this many seconds of the last sync are served without asking Google for changes, so the
+# several lookups of one agent turn cost a single incremental sync at most
+MAX_STALENESS = 30
+# Events per page when syncing
+SYNC_PAGE_SIZE = 2500
+# The mirror holds the events from this many days ago to this many days ahead. Listing without bounds never
+# ends, singleEvents expands a recurring event with no end date into instances forever.
+MIRROR_PAST_DAYS = 30
+MIRROR_FUTURE_DAYS = 365
+# Once the window has fallen this many days behind, the next sync moves it forward with a full sync
+WINDOW_REFRESH_DAYS = 7
+DAY = 24 * 60 * 60
+
+
+class EventMirror:
+    # Local SQLite copy of a window of a Google calendar, kept fresh with incremental sync: the first sync
+    # lists every event in the window, after that the saved syncToken makes Google send only what changed
+    # (deleted events come back with status 'cancelled'). Start and end are stored as epoch seconds for range
+    # queries. Reads the window can't answer return None, for the caller to ask the API instead.
+    def __init__(self, service, path=DEFAULT_MIRROR_PATH, calendar_id='primary', time_zone="America/Los_Angeles",
+                 max_staleness=MAX_STALENESS, past_days=MIRROR_PAST_DAYS, future_days=MIRROR_FUTURE_DAYS):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.service = service
+        self.calendar_id = calendar_id
+        self.time_zone = pytz.timezone(time_zone)
+        self.max_staleness = max_staleness
+        self.past_days = past_days
+        self.future_days = future_days
+        # (start, end) epoch seconds of the events the mirror holds, set by the first sync
+        self.window = None
+        self.last_sync = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                summary TEXT,
+                description TEXT,
+                location TEXT,
+                start_ts REAL NOT NULL,
+                end_ts REAL NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, event_id)
+            )
+        """)
+        # The syncToken to continue from and the window it covers, per calendar
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                calendar_id TEXT PRIMARY KEY,
+                sync_token TEXT NOT NULL,
+                synced_at REAL NOT NULL,
+                window_start REAL,
+                window_end REAL
+            )
+        """)
+        # Mirrors made before there was a window don't have the columns yet, their next sync is a full one
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sync_state)")]
+        for column in ("window_start", "window_end"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE sync_state ADD COLUMN {column} REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS events_start ON events (calendar_id, start_ts)")
+        self._conn.commit()
+
+    def _timestamp(self, when):
+        # All-day events only have a date, which starts at midnight in the calendar's time zone
+        moment = datetime.fromisoformat(when.get('dateTime', when.get('date')).replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = self.time_zone.localize(moment)
+        return moment.timestamp()
+
+    def _apply(self, event):
+        if event.get('status') != 'cancelled':
+            start_ts, end_ts = self._timestamp(event['start']), self._timestamp(event['end'])
+            # Incremental syncs also send changes outside the window, and an event can be moved out of it
+            if self.window is None or (start_ts < self.window[1] and end_ts > self.window[0]):
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.calendar_id, event['id'], event.get('summary'), event.get('description'),
+                     event.get('location'), start_ts, end_ts, json.dumps(event)),
+                )
+                return
+        self._conn.execute("DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                           (self.calendar_id, event['id']))
+
+    def sync(self, force=False):
+        # Pulls the changes since the last sync, or everything in the window the first time and whenever the
+        # window needs to move forward. Returns the number of changes.
+        with self._lock:
+            if not force and time.time() - self.last_sync < self.max_staleness:
+                return 0
+            row = self._conn.execute("SELECT sync_token, window_start, window_end FROM sync_state WHERE calendar_id = ?",
+                                     (self.calendar_id,)).fetchone()
+            if row is None or row[2] is None or time.time() + self.future_days * DAY - row[2] > WINDOW_REFRESH_DAYS * DAY:
+                changes = self._pull(None)
+            else:
+                self.window = (row[1], row[2])
+                try:
+                    changes = self._pull(row[0])
+                except Exception as e:
+                    # 410 Gone means the token expired, Google wants a full sync from scratch
+                    if getattr(getattr(e, 'resp', None), 'status', None) != 410:
+                        raise
+                    print("🔄 Calendar sync token expired, syncing everything again")
+                    changes = self._pull(None)
+            self.last_sync = time.time()
+            return changes
+
+    def _pull(self, sync_token):
+        changes = 0
+        page_token = None
+        previous_window = self.window
+        bounds = {}
+        if sync_token is None:
+            now = time.time()
+            self.window = (now - self.past_days * DAY, now + self.future_days * DAY)
+            # Google doesn't take timeMin/timeMax together with a syncToken, only on the full sync
+            bounds = {'timeMin': self._rfc3339(self.window[0]), 'timeMax': self._rfc3339(self.window[1])}
+            self._conn.execute("DELETE FROM events WHERE calendar_id = ?", (self.calendar_id,))
+        try:
+            while True:
+                result = self.service.events().list(
+                    calendarId=self.calendar_id,
+                    singleEvents=True,
+                    maxResults=SYNC_PAGE_SIZE,
+                    syncToken=sync_token,
+                    pageToken=page_token,
+                    **bounds
+                ).execute()
+                for event in result.get('items', []):
+                    self._apply(event)
+                    changes += 1
+                page_token = result.get('nextPageToken')
+                if not page_token:
+                    break
+            # Only the last page has the token, saved in the same transaction as the events it covers
+            self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)",
+                               (self.calendar_id, result['nextSyncToken'], time.time()) + self.window)
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            self.window = previous_window
+            raise
+        return changes
+
+    def _rfc3339(self, timestamp):
+        return datetime.fromtimestamp(timestamp, pytz.utc).isoformat().replace('+00:00', 'Z')
+
+    def _covers(self, time_min, time_max):
+        # Whether every event overlapping [time_min, time_max] (epoch seconds) is in the mirror
+        return self.window is not None and self.window[0] <= time_min and time_max <= self.window[1]
+
+    # Write-through: after a successful API call, the returned event goes straight into the mirror
+
+    def put(self, event):
+        with self._lock:
+            self._apply(event)
+            self._conn.commit()
+
+    def remove(self, event_id):
+        with self._lock:
+            self._apply({'id': event_id, 'status': 'cancelled'})
+            self._conn.commit()
+
+    def get(self, event_id):
+        # None if there's no such event in the window
+        self.sync()
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM events WHERE calendar_id = ? AND event_id = ?",
+                                     (self.calendar_id, event_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def events_between(self, time_min, time_max):
+        # Events overlapping [time_min, time_max] (aware datetimes), ordered by start time.
+        # None if the range isn't all inside the window.
+        self.sync()
+        with self._lock:
+            if not self._covers(time_min.timestamp(), time_max.timestamp()):
+                return None
+            rows = self._conn.execute(
+                "SELECT data FROM events WHERE calendar_id = ? AND start_ts < ? AND end_ts > ? ORDER BY start_ts",
+                (self.calendar_id, time_max.timestamp(), time_min.timestamp()),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def search(self, query, time_min, max_results=10):
+        # Events that haven't ended by time_min with the query in their summary, description or location,
+        # case-insensitive, ordered by start time. Narrower than events().list with q, which matches words
+        # and also looks at attendees and the organizer. None if there could be more matches than the window
+        # holds: time_min is before it, or fewer than max_results were found (others may come after it).
+        self.sync()
+        with self._lock:
+            if not self._covers(time_min.timestamp(), time_min.timestamp()):
+                return None
+            rows = self._conn.execute(
+                """
+                SELECT data FROM events
+                WHERE calendar_id = ? AND end_ts > ?
+                  AND instr(lower(coalesce(summary, '') || ' ' || coalesce(description, '') || ' ' || coalesce(location, '')), lower(?)) > 0
+                ORDER BY start_ts LIMIT ?
+                """,
+                (self.calendar_id, time_min.timestamp(), query, max_results),
+            ).fetchall()
+        if len(rows) < max_results:
+            return None
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM events WHERE calendar_id = ?",
+                                      (self.calendar_id,)).fetchone()[0]
+
+    def close(self):
+        self._conn.close()
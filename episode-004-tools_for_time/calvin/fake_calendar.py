@@ -0,0 +1,213 @@
+import time
+import uuid
+import random
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# The Calendar API turns down batch requests with more calls than this
+MAX_BATCH_CALLS = 50
+
+
+class FakeHttpError(Exception):
+    # Looks like googleapiclient.errors.HttpError, the status is on .resp.status
+    def __init__(self, status, message):
+        super().__init__(f"<HttpError {status}: {message}>")
+        self.resp = SimpleNamespace(status=status)
+
+
+class FakeRequest:
+    def __init__(self, service, fn):
+        self.service = service
+        self.fn = fn
+
+    def execute(self):
+        self.service.requests += 1
+        time.sleep(self.service.latency)
+        return self.fn()
+
+
+class FakeBatchRequest:
+    # Like googleapiclient's BatchHttpRequest: the whole batch is one request, and every call's
+    # response or exception is handed to its callback
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.calls = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id if request_id is not None else str(len(self.calls))
+        self.calls.append((request, callback or self.callback, request_id))
+
+    def execute(self):
+        self.service.requests += 1
+        time.sleep(self.service.latency)
+        if len(self.calls) > MAX_BATCH_CALLS:
+            raise FakeHttpError(400, f"Too many requests in batch, the limit is {MAX_BATCH_CALLS}")
+        for request, callback, request_id in self.calls:
+            try:
+                response, exception = request.fn(), None
+            except FakeHttpError as e:
+                response, exception = None, e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class FakeEvents:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, calendarId='primary', timeMin=None, timeMax=None, q=None, maxResults=250, pageToken=None,
+             syncToken=None, **kwargs):
+        def run():
+            if syncToken is not None:
+                return self._sync(syncToken, maxResults, pageToken)
+            events = sorted(self.service.active_events(), key=lambda event: self.service.start_of(event))
+            if timeMin:
+                events = [event for event in events if self.service.end_of(event) > parse_time(timeMin)]
+            if timeMax:
+                events = [event for event in events if self.service.start_of(event) < parse_time(timeMax)]
+            if q:
+                events = [event for event in events if q.lower() in " ".join(
+                    event.get(field, "") for field in ("summary", "description", "location")).lower()]
+            offset = int(pageToken or 0)
+            page = events[offset:offset + maxResults]
+            result = {"items": [self.service.public(event) for event in page]}
+            if offset + maxResults < len(events):
+                result["nextPageToken"] = str(offset + maxResults)
+            else:
+                result["nextSyncToken"] = str(self.service.version)
+            return result
+        return FakeRequest(self.service, run)
+
+    def _sync(self, sync_token, max_results, page_token):
+        # Everything changed since the token, deleted events come back with status 'cancelled'
+        if int(sync_token) < self.service.oldest_sync_version:
+            raise FakeHttpError(410, "Sync token is no longer valid, a full sync is required.")
+        changed = sorted(
+            (event for event in self.service.stored_events.values() if event["_version"] > int(sync_token)),
+            key=lambda event: event["_version"],
+        )
+        offset = int(page_token or 0)
+        result = {"items": [self.service.public(event) for event in changed[offset:offset + max_results]]}
+        if offset + max_results < len(changed):
+            result["nextPageToken"] = str(offset + max_results)
+        else:
+            result["nextSyncToken"] = str(self.service.version)
+        return result
+
+    def get(self, calendarId='primary', eventId=None):
+        def run():
+            if not self.service.is_active(eventId):
+                raise FakeHttpError(404, f"Event {eventId} not found")
+            return self.service.public(self.service.stored_events[eventId])
+        return FakeRequest(self.service, run)
+
+    def insert(self, calendarId='primary', body=None):
+        return FakeRequest(self.service, lambda: self.service.add_event(body))
+
+    def update(self, calendarId='primary', eventId=None, body=None):
+        def run():
+            if not self.service.is_active(eventId):
+                raise FakeHttpError(404, f"Event {eventId} not found")
+            return self.service.add_event(dict(body, id=eventId))
+        return FakeRequest(self.service, run)
+
+    def patch(self, calendarId='primary', eventId=None, body=None):
+        def run():
+            if not self.service.is_active(eventId):
+                raise FakeHttpError(404, f"Event {eventId} not found")
+            return self.service.add_event(dict(self.service.stored_events[eventId], **body, id=eventId))
+        return FakeRequest(self.service, run)
+
+    def delete(self, calendarId='primary', eventId=None):
+        def run():
+            if not self.service.is_active(eventId):
+                raise FakeHttpError(410 if eventId in self.service.stored_events else 404, f"Event {eventId} not found")
+            self.service.version += 1
+            self.service.stored_events[eventId] = {"id": eventId, "status": "cancelled", "_version": self.service.version}
+            return ""
+        return FakeRequest(self.service, run)
+
+
+class FakeCalendarService:
+    # In-memory stand-in for the Google Calendar service object (build('calendar', 'v3', ...)), for running
+    # CalendarManager offline in benchmarks and tests. Every execute() counts as one request and sleeps
+    # `latency` seconds. Supports incremental sync: every change bumps a version, which is the sync token.
+    def __init__(self, time_zone="America/Los_Angeles", latency=0.0):
+        self.time_zone = ZoneInfo(time_zone)
+        self.latency = latency
+        self.requests = 0
+        self.stored_events = {}
+        self.version = 0
+        self.oldest_sync_version = 0
+
+    def events(self):
+        return FakeEvents(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+    def active_events(self):
+        return [event for event in self.stored_events.values() if event.get("status") != "cancelled"]
+
+    def is_active(self, event_id):
+        return event_id in self.stored_events and self.stored_events[event_id].get("status") != "cancelled"
+
+    def public(self, event):
+        return {key: value for key, value in event.items() if key != "_version"}
+
+    def expire_sync_tokens(self):
+        # Like Google does now and then, the next incremental sync gets a 410 and has to start over
+        self.oldest_sync_version = self.version + 1
+
+    def add_event(self, body):
+        event = dict(body)
+        event.pop("_version", None)
+        event.setdefault("id", uuid.uuid4().hex)
+        for key in ("start", "end"):
+            # Google returns dateTimes with the UTC offset filled in
+            if "dateTime" in event[key]:
+                moment = parse_time(event[key]["dateTime"], self.time_zone)
+                event[key] = dict(event[key], dateTime=moment.isoformat())
+        event["htmlLink"] = f"https://calendar.google.com/event?eid={event['id']}"
+        event["status"] = "confirmed"
+        self.version += 1
+        event["_version"] = self.version
+        self.stored_events[event["id"]] = event
+        return self.public(event)
+
+    def start_of(self, event):
+        return parse_time(event["start"].get("dateTime", event["start"].get("date")), self.time_zone)
+
+    def end_of(self, event):
+        return parse_time(event["end"].get("dateTime", event["end"].get("date")), self.time_zone)
+
+
+def parse_time(value, time_zone=ZoneInfo("UTC")):
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return moment if moment.tzinfo else moment.replace(tzinfo=time_zone)
+
+
+def make_synthetic_calendar(num_events, start_date, days, time_zone="America/Los_Angeles", latency=0.0, seed=0):
+    # A calendar with `num_events` random 15 minute to 3 hour events between 7:00 and 23:00, and a few all-day events
+    rng = random.Random(seed)
+    service = FakeCalendarService(time_zone, latency=latency)
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    for i in range(num_events):
+        day = start + timedelta(days=rng.randrange(days))
+        if rng.random() < 0.02:
+            service.add_event({
+                "summary": f"All day {i}",
+                "start": {"date": day.strftime("%Y-%m-%d")},
+                "end": {"date": (day + timedelta(days=1)).strftime("%Y-%m-%d")},
+            })
+            continue
+        event_start = day + timedelta(minutes=rng.randrange(7 * 60, 23 * 60, 15))
+        event_end = event_start + timedelta(minutes=rng.choice([15, 30, 45, 60, 90, 120, 180]))
+        service.add_event({
+            "summary": f"Event {i}",
+            "start": {"dateTime": event_start.isoformat(), "timeZone": time_zone},
+            "end": {"dateTime": event_end.isoformat(), "timeZone": time_zone},
+        })
+    return service
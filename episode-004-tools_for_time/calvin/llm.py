@@ -1,6 +1,9 @@
+import re
+import json
 import datetime
 import anthropic
-from cal import calendar_manager
+from concurrent.futures import ThreadPoolExecutor
+from cal import get_calendar_manager
 from rich.console import Console
 from rich.panel import Panel
 from rich.markdown import Markdown
@@ -8,6 +11,22 @@ from rich import box
 
 client = anthropic.Anthropic()
 console = Console()
+
+# Most tool calls from one response that run at the same time
+MAX_TOOL_WORKERS = 8
+# Prompt size in tokens past which older tool calls in the history get shortened, and then the oldest turns dropped
+HISTORY_TOKEN_BUDGET = 20000
+# Tool calls and results from the latest calls that are always kept in full
+KEEP_RECENT_TOOL_RESULTS = 6
+# How much of an older tool result or tool input is kept when compacting
+COMPACTED_RESULT_CHARS = 200
+# Rough size of a token, for estimating how much compacting saved
+CHARS_PER_TOKEN = 4
+# End of a tool result or input that was already compacted, so it isn't shortened again
+COMPACTED_PATTERN = re.compile(r"\.\.\. \[compacted, \d+ more characters\]$")
+# Marks where a prompt cache prefix ends, everything up to it is reused by the next call instead of processed again
+CACHE_CONTROL = {"type": "ephemeral"}
+
 tool_list =  [
     {
                 "name": "create_event",
@@ -112,13 +131,18 @@ tool_list =  [
                         "day_end": {"type": "string", "description": "Optional. End time of day in format HH:MM (24-hour)"}
                     },
                     "required": ["start_date", "end_date"]
-                }
+                },
+                # The tool definitions never change, so they're cached
+                "cache_control": CACHE_CONTROL
             }
 ]
-def llm(conversation_history):
-    now = datetime.datetime.now().strftime("%A, %B %d, %Y at %I:%M %p")
 
-    system_message = f"You are a helpful calendar assistant. You can use these tools to manage the user's calendar: {', '.join([tool['name'] for tool in tool_list])}. If a user doesn't give you enough information, like a start time or end time, you are allowed to make assumptions, and fill in the blanks however you see fit. The user generally does NOT want to be asked for follow up questions, unless absolutely necessary. You can now create and delete multiple events at once using the create_multiple_events and delete_multiple_events tools. Today's date is: {now}."
+# The system prompt never changes, so it's cached together with the tools. The current time goes in the
+# newest message instead, after the cached history, so it doesn't invalidate the cache every minute.
+SYSTEM_PROMPT = f"You are a helpful calendar assistant. You can use these tools to manage the user's calendar: {', '.join([tool['name'] for tool in tool_list])}. If a user doesn't give you enough information, like a start time or end time, you are allowed to make assumptions, and fill in the blanks however you see fit. The user generally does NOT want to be asked for follow up questions, unless absolutely necessary. You can now create and delete multiple events at once using the create_multiple_events and delete_multiple_events tools."
+
+def llm(conversation_history):
+    system_message = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": CACHE_CONTROL}]
 
     while True:
         response = client.messages.create(
@@ -126,39 +150,49 @@ def llm(conversation_history):
             max_tokens=1024,
             system=system_message,
             tools=tool_list,
-            messages=conversation_history
+            messages=with_cache_breakpoint(conversation_history, current_time_block())
         )
+        report_usage(response.usage)
+
+        # Past the budget, the old tool calls are cut short (the next call writes a new cache for the shorter history)
+        if prompt_tokens(response.usage) > HISTORY_TOKEN_BUDGET:
+            compacted, dropped = compact_history(conversation_history, prompt_tokens(response.usage))
+            if compacted or dropped:
+                console.print(f"[dim]🗜️  Compacted {compacted} older tool calls and dropped the {dropped} oldest turns to stay under {HISTORY_TOKEN_BUDGET} tokens[/dim]")
         
         if response.stop_reason == "tool_use":
+            tool_uses = []
             for content in response.content:
                 if content.type == "text":
                     md = Markdown(content.text)
                     console.print(Panel(md, title="[bold cyan]AI Assistant[/bold cyan]", border_style="cyan", box=box.ROUNDED))
                     console.print()
                 if content.type == "tool_use":
-                    tool_name = content.name
-                    tool_input = content.input
-                    tool_use_id = content.id
-                    
-                    intermediate_result = f"Using tool: {tool_name}\nInput: {tool_input}"
+                    intermediate_result = f"Using tool: {content.name}\nInput: {content.input}"
                     md = Markdown(intermediate_result)
                     console.print(Panel(md, title="[bold magenta]Tool Use[/bold magenta]", border_style="magenta", box=box.ROUNDED))
                     console.print()
-                    
-                    result = execute_tool(tool_name, tool_input)
-                    
-                    md = Markdown(result)
-                    console.print(Panel(md, title="[bold green]Tool Result[/bold green]", border_style="green", box=box.ROUNDED))
-                    console.print()
-                    
-                    conversation_history.append({"role": "assistant", "content": response.content})
-                    conversation_history.append({"role": "user", "content": [
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": tool_use_id,
-                            "content": result
-                        }
-                    ]})
+                    tool_uses.append(content)
+
+            # All the tool calls of this turn run at once, so the turn takes as long as the slowest one
+            with ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS) as executor:
+                results = list(executor.map(run_tool, tool_uses))
+
+            tool_results = []
+            for content, (result, is_error) in zip(tool_uses, results):
+                md = Markdown(result)
+                console.print(Panel(md, title="[bold green]Tool Result[/bold green]", border_style="red" if is_error else "green", box=box.ROUNDED))
+                console.print()
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": content.id,
+                    "content": result,
+                    "is_error": is_error
+                })
+
+            # One assistant message with every tool_use, answered by one user message with every tool_result, in the same order
+            conversation_history.append({"role": "assistant", "content": response.content})
+            conversation_history.append({"role": "user", "content": tool_results})
             
             # Continue the loop to allow for more tool calls
             continue
@@ -168,7 +202,103 @@ def llm(conversation_history):
     
     return response.content[0].text if response.content else "I apologize, but I couldn't generate a response."
 
+def current_time_block():
+    now = datetime.datetime.now().strftime("%A, %B %d, %Y at %I:%M %p")
+    return {"type": "text", "text": f"Today's date is: {now}."}
+
+def with_cache_breakpoint(conversation_history, extra_block=None):
+    # A copy of the history with a cache breakpoint on its last block, so the next call in the tool loop
+    # reads the whole conversation so far from the cache. extra_block (the current time) goes after the
+    # breakpoint, outside the cached prefix. The history itself is left as it is.
+    messages = list(conversation_history)
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = list(content)
+    if content and isinstance(content[-1], dict):
+        content[-1] = dict(content[-1], cache_control=CACHE_CONTROL)
+    if extra_block:
+        content.append(extra_block)
+    messages[-1] = dict(last, content=content)
+    return messages
+
+def prompt_tokens(usage):
+    # Everything that went into the prompt, whether it came from the cache or not
+    return usage.input_tokens + (getattr(usage, "cache_read_input_tokens", None) or 0) + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+
+def report_usage(usage):
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    console.print(f"[dim]📊 Tokens: {prompt_tokens(usage)} in ({cache_read} read from cache, {cache_write} written to cache, {usage.input_tokens} uncached), {usage.output_tokens} out[/dim]")
+
+def block_field(block, name):
+    # History blocks are dicts, or the SDK's block objects in the assistant messages from response.content
+    return block.get(name) if isinstance(block, dict) else getattr(block, name, None)
+
+def shorten(text):
+    return f"{text[:COMPACTED_RESULT_CHARS]}... [compacted, {len(text) - COMPACTED_RESULT_CHARS} more characters]"
+
+def estimate_tokens(message):
+    content = message["content"]
+    if not isinstance(content, str):
+        content = json.dumps([block if isinstance(block, dict) else block.model_dump() for block in content], default=str)
+    return len(content) // CHARS_PER_TOKEN
+
+def compact_history(conversation_history, prompt_size):
+    # Shortens every tool result and tool input except the latest KEEP_RECENT_TOOL_RESULTS to its first
+    # COMPACTED_RESULT_CHARS characters, the model still sees which tool ran with roughly what and what it
+    # returned. If that isn't estimated to bring the prompt (prompt_size tokens now) under HISTORY_TOKEN_BUDGET,
+    # the oldest turns are dropped too, each one a user question up to the next. The current turn is always
+    # kept. Returns how many tool calls were shortened and how many turns were dropped.
+    tool_blocks = {"tool_use": [], "tool_result": []}
+    for message in conversation_history:
+        if isinstance(message["content"], list):
+            for i, block in enumerate(message["content"]):
+                if block_field(block, "type") in tool_blocks:
+                    tool_blocks[block_field(block, "type")].append((message["content"], i))
+    compacted = 0
+    saved_chars = 0
+    for content, i in tool_blocks["tool_result"][:max(len(tool_blocks["tool_result"]) - KEEP_RECENT_TOOL_RESULTS, 0)]:
+        result = content[i]["content"]
+        if isinstance(result, str) and len(result) > COMPACTED_RESULT_CHARS and not COMPACTED_PATTERN.search(result):
+            content[i] = dict(content[i], content=shorten(result))
+            compacted += 1
+            saved_chars += len(result) - len(content[i]["content"])
+    for content, i in tool_blocks["tool_use"][:max(len(tool_blocks["tool_use"]) - KEEP_RECENT_TOOL_RESULTS, 0)]:
+        tool_input = json.dumps(block_field(content[i], "input"))
+        if len(tool_input) > COMPACTED_RESULT_CHARS and "compacted_input" not in block_field(content[i], "input"):
+            # The input has to stay an object, the API rejects anything else
+            content[i] = {"type": "tool_use", "id": block_field(content[i], "id"), "name": block_field(content[i], "name"),
+                          "input": {"compacted_input": shorten(tool_input)}}
+            compacted += 1
+            saved_chars += len(tool_input) - len(json.dumps(content[i]["input"]))
+
+    excess = prompt_size - saved_chars // CHARS_PER_TOKEN - HISTORY_TOKEN_BUDGET
+    dropped = 0
+    while excess > 0:
+        # A turn starts with the user's own message, tool results are user messages too but belong to the turn before
+        turn_starts = [i for i, message in enumerate(conversation_history)
+                       if message["role"] == "user" and isinstance(message["content"], str)]
+        if len(turn_starts) < 2:
+            break
+        excess -= sum(estimate_tokens(message) for message in conversation_history[:turn_starts[1]])
+        del conversation_history[:turn_starts[1]]
+        dropped += 1
+    return compacted, dropped
+
+def run_tool(tool_use):
+    # Returns (result text, is_error), one failing tool shouldn't lose the results of the others
+    try:
+        result = execute_tool(tool_use.name, tool_use.input)
+    except Exception as e:
+        return f"Error: {tool_use.name} failed: {e}", True
+    return result if isinstance(result, str) else str(result), False
+
 def execute_tool(tool_name, tool_input):
+    calendar_manager = get_calendar_manager()
     if tool_name == "create_event":
         return calendar_manager.create_event(**tool_input)
     elif tool_name == "edit_event":
@@ -4,6 +4,7 @@ from rich.prompt import Prompt
 from rich.markdown import Markdown
 from rich import box
 from llm import llm
+from cal import get_calendar_manager
 
 console = Console()
 
@@ -20,6 +21,9 @@ def main():
                               
           """)
     
+    # Sign in to Google Calendar before the first question
+    get_calendar_manager()
+    
     console.print(Panel.fit("🗓️ [bold cyan]Hi! I'm Calvin, your AI Calendar Assistant! What can I help you with today?[/bold cyan] 🤖", border_style="bold green"))
     
     while True: